@@ -0,0 +1,55 @@
+'''Helpers shared by benchmarks
+'''
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import os
+import sys
+import time
+import tracemalloc
+import types
+
+# benchmarks run offline, on the collection pure python code
+for _plugins in ['module_utils', 'filter']:
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                    '..', 'plugins', _plugins))
+
+# filters only need ansible for their error type
+try:
+    import ansible.errors  # noqa: F401
+except ImportError:
+    class AnsibleFilterError(Exception):
+        pass
+
+    sys.modules['ansible'] = types.ModuleType('ansible')
+    sys.modules['ansible.errors'] = types.ModuleType('ansible.errors')
+    sys.modules['ansible.errors'].AnsibleFilterError = AnsibleFilterError
+    sys.modules['ansible'].errors = sys.modules['ansible.errors']
+
+
+def measure(setup, repeat=3):
+    '''Measures the function returned by setup()
+
+    setup() is called before each run, out of measurement, so that runs do
+    not share mutated inputs. Returns the best time of `repeat` runs and the
+    peak memory allocated during an additional traced run.
+    '''
+    best = None
+    for _ in range(repeat):
+        func = setup()
+
+        t = time.perf_counter()
+        func()
+        t = time.perf_counter() - t
+
+        best = t if best is None else min(best, t)
+
+    func = setup()
+
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return best, peak
@@ -0,0 +1,152 @@
+'''Synthetic resource forests
+
+Forests are given as irods_resc `roots` parameters, and can be turned into
+the iquest output resc_trees() parses.
+'''
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import copy
+import itertools
+
+import common  # noqa: F401 (sets module_utils path)
+
+from irods_utils import _IQUEST_SEPARATOR
+
+
+SHAPES = ['wide', 'deep', 'mixed']
+
+ZONE = 'benchZone'
+
+_DEEP_DEPTH = 32
+_MIXED_FANOUT = 4
+_MIXED_DEPTH = 3
+
+
+def _leaf(n):
+    return dict(
+        name='resc%d' % n,
+        type='unixfilesystem',
+        loc='host%d.example.org' % (n % 97),
+        path='/var/lib/irods/Vault%d' % n,
+    )
+
+
+def _node(n, type, children):
+    return dict(name='resc%d' % n, type=type, children=children)
+
+
+def wide(n):
+    '''One replication root with n - 1 leaves
+    '''
+    ids = itertools.count()
+    root = next(ids)
+
+    return [_node(root, 'replication',
+                  [_leaf(next(ids)) for _ in range(n - 1)])]
+
+
+def deep(n):
+    '''Chains of passthru resources ending with a leaf
+    '''
+    ids = itertools.count()
+    roots = []
+
+    for _ in range(max(1, n // _DEEP_DEPTH)):
+        tree = _leaf(next(ids))
+        for _ in range(min(n, _DEEP_DEPTH) - 1):
+            tree = _node(next(ids), 'passthru', [tree])
+        roots.append(tree)
+
+    return roots
+
+
+def mixed(n):
+    '''Trees of replication/random resources, leaves being storage ones
+    '''
+    ids = itertools.count()
+    size = sum(_MIXED_FANOUT ** d for d in range(_MIXED_DEPTH))
+
+    def tree(depth):
+        if depth == _MIXED_DEPTH - 1:
+            return _leaf(next(ids))
+
+        n = next(ids)
+        children = [tree(depth + 1) for _ in range(_MIXED_FANOUT)]
+
+        return _node(n, ['replication', 'random'][depth % 2], children)
+
+    return [tree(0) for _ in range(max(1, n // size))]
+
+
+def forest(shape, n):
+    return dict(wide=wide, deep=deep, mixed=mixed)[shape](n)
+
+
+def count(roots):
+    return sum(1 + count(r.get('children', [])) for r in roots)
+
+
+def modified(roots, every=10):
+    '''Returns a copy of roots where one leaf out of `every` is modified,
+    removed or replaced with a new one
+    '''
+    roots = copy.deepcopy(roots)
+    leaves = itertools.count()
+
+    def walk(node):
+        children = []
+        for c in node.get('children', []):
+            if 'children' in c:
+                walk(c)
+                children.append(c)
+                continue
+
+            i = next(leaves)
+            if i % every == 0:
+                c['comment'] = 'modified'
+            elif i % every == 1:
+                continue
+            elif i % every == 2:
+                c = dict(c, name=c['name'] + 'new')
+            children.append(c)
+
+        if 'children' in node:
+            node['children'] = children
+
+    for r in roots:
+        walk(r)
+
+    return roots
+
+
+def iquest_lines(roots, zone=ZONE):
+    '''Yields the iquest output of resc_trees() query for roots
+    '''
+    ids = itertools.count(10000)
+
+    def walk(node, parent):
+        rid = next(ids)
+
+        yield _IQUEST_SEPARATOR.join([
+            str(rid),
+            '' if parent is None else str(parent),
+            node['name'],
+            zone,
+            node['type'],
+            node.get('loc', 'EMPTY_RESC_HOST'),
+            node.get('path', 'EMPTY_RESC_PATH'),
+            '',
+            node.get('comment', ''),
+            '',
+            '',
+        ]) + '\n'
+
+        for c in node.get('children', []):
+            for l in walk(c, rid):
+                yield l
+
+    for r in roots:
+        for l in walk(r, None):
+            yield l
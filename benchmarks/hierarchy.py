@@ -0,0 +1,95 @@
+'''Resource hierarchy hot paths on synthetic forests
+'''
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import common  # noqa: F401 (sets plugins paths)
+import forests
+
+from irods_utils import (
+    _IQUEST_SEPARATOR,
+    _RESC_FIELDS,
+    build_resc_trees,
+    diff_hierarchies,
+    dump_hierarchies,
+    hierarchy_operations,
+    match_hierarchies,
+    operation_waves,
+    params_to_hierarchy,
+    parse_iquest_line,
+)
+from resc_tree import filter_resc
+
+
+class _DiffModule:
+    params = dict(diff_mode='changed', diff_context=1, diff_max_size=65536)
+
+
+def _got(roots):
+    return build_resc_trees(
+        parse_iquest_line(l, _RESC_FIELDS, _IQUEST_SEPARATOR)
+        for l in forests.iquest_lines(roots)
+    )
+
+
+def _wanted(roots, got):
+    wanted = params_to_hierarchy(roots, forests.ZONE)
+    match_hierarchies(wanted, got)
+
+    return wanted
+
+
+def cases(sizes, shapes):
+    for shape in shapes:
+        for n in sizes:
+            roots = forests.forest(shape, n)
+            lines = list(forests.iquest_lines(roots))
+            got = _got(roots)
+            target = forests.modified(roots)
+            wanted = _wanted(target, got)
+            operations = hierarchy_operations(got, wanted)
+
+            def resc_trees(lines=lines):
+                return lambda: build_resc_trees(
+                    parse_iquest_line(l, _RESC_FIELDS, _IQUEST_SEPARATOR)
+                    for l in lines
+                )
+
+            def to_hierarchy(roots=roots):
+                return lambda: params_to_hierarchy(roots, forests.ZONE)
+
+            def match(target=target, got=got):
+                wanted = params_to_hierarchy(target, forests.ZONE)
+                return lambda: match_hierarchies(wanted, got)
+
+            def compare(got=got, wanted=wanted):
+                # hierarchy_operations() does not modify its arguments
+                return lambda: hierarchy_operations(got, wanted)
+
+            def waves(operations=operations):
+                return lambda: operation_waves(operations)
+
+            def dump(got=got):
+                return lambda: dump_hierarchies(got)
+
+            def diff(got=got, wanted=wanted):
+                return lambda: diff_hierarchies(_DiffModule, got, wanted)
+
+            def to_dicts(got=got):
+                return lambda: got.to_dicts()
+
+            yield 'resc_trees', shape, n, resc_trees
+            yield 'params_to_hierarchy', shape, n, to_hierarchy
+            yield 'match_hierarchies', shape, n, match
+            yield 'compare_hierarchies', shape, n, compare
+            yield 'operation_waves', shape, n, waves
+            yield 'dump_hierarchies', shape, n, dump
+            yield 'diff_hierarchies', shape, n, diff
+            yield 'to_dicts', shape, n, to_dicts
+
+            def filter(got=got):
+                trees = got.to_dicts()
+                return lambda: filter_resc(trees, type='unixfilesystem')
+
+            yield 'filter_resc', shape, n, filter
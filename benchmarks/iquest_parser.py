@@ -0,0 +1,75 @@
+'''Peak memory and time of iquest output parsing
+
+Compares parsing captured iquest output as a whole (the former
+`o.strip().split('\n')` readers) with streaming it line by line through
+parse_iquest_line() while only indexing a few wanted users.
+'''
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+from tempfile import TemporaryFile
+
+import common  # noqa: F401 (sets module_utils path)
+
+from irods_utils import _IQUEST_SEPARATOR, parse_iquest_line
+
+
+_USER_FIELDS = [
+    'USER_ID',
+    'USER_NAME',
+    'USER_TYPE',
+    'USER_ZONE',
+    'USER_INFO',
+    'USER_COMMENT',
+]
+
+
+def iquest_users_output(f, n):
+    for i in range(n):
+        f.write(_IQUEST_SEPARATOR.join([
+            str(10000 + i),
+            'user%d' % i,
+            'rodsuser',
+            'tempZone',
+            'some info',
+            'some comment',
+        ]) + '\n')
+    f.seek(0)
+
+
+def captured(f, wanted):
+    o = f.read()
+
+    users = {}
+    for l in o.strip().split('\n'):
+        values = l.strip('\r\n').split(_IQUEST_SEPARATOR)
+        user = dict(zip(_USER_FIELDS, values))
+        users[user['USER_NAME']] = user
+
+    return {k: v for k, v in users.items() if k in wanted}
+
+
+def streamed(f, wanted):
+    users = {}
+    for l in f:
+        user = parse_iquest_line(l, _USER_FIELDS, _IQUEST_SEPARATOR)
+        if user['USER_NAME'] in wanted:
+            users[user['USER_NAME']] = user
+
+    return users
+
+
+def cases(sizes, shapes=None):
+    for n in sizes:
+        wanted = set(['user%d' % i for i in range(0, n, max(1, n // 3))])
+
+        f = TemporaryFile(mode='w+')
+        iquest_users_output(f, n)
+
+        for func in [captured, streamed]:
+            def setup(func=func, f=f):
+                f.seek(0)
+                return lambda: func(f, wanted)
+
+            yield 'iquest_users_' + func.__name__, 'users', n, setup
@@ -0,0 +1,69 @@
+#! /usr/bin/env python3
+'''Runs the collection micro-benchmarks
+
+Benchmarks only exercise pure python code on synthetic data: no iRODS
+server nor icommands are needed. Reports the best time and the peak memory
+of each case.
+'''
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import common  # noqa: E402
+import forests  # noqa: E402
+import hierarchy  # noqa: E402
+import iquest_parser  # noqa: E402
+
+
+SUITES = [hierarchy, iquest_parser]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', default='10,100,1000,10000',
+                        help='comma separated numbers of nodes/rows '
+                             '(default: %(default)s, up to 100000)')
+    parser.add_argument('--shapes', default=','.join(forests.SHAPES),
+                        help='comma separated forest shapes '
+                             '(default: %(default)s)')
+    parser.add_argument('--only', action='append', default=[],
+                        help='only run cases whose name contains ONLY')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='timed runs per case (default: %(default)s)')
+    parser.add_argument('--json', action='store_true',
+                        help='print results as JSON lines')
+    args = parser.parse_args()
+
+    sizes = [int(n) for n in args.sizes.split(',')]
+    shapes = args.shapes.split(',')
+
+    if not args.json:
+        print('%-28s %-6s %8s %12s %14s' %
+              ('case', 'shape', 'n', 'time (s)', 'peak (KiB)'))
+
+    for suite in SUITES:
+        for name, shape, n, setup in suite.cases(sizes, shapes):
+            if args.only and not any(o in name for o in args.only):
+                continue
+
+            t, peak = common.measure(setup, args.repeat)
+
+            if args.json:
+                print(json.dumps(dict(case=name, shape=shape, n=n, time=t,
+                                      peak=peak)))
+            else:
+                print('%-28s %-6s %8d %12.6f %14.1f' %
+                      (name, shape, n, t, peak / 1024.))
+
+            sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+
+class ModuleDocFragment(object):
+
+    # options shared by the modules reading the iRODS catalog
+    DOCUMENTATION = r'''
+options:
+  query_backend:
+    description:
+      - "How catalog queries are run. `iquest` spawns one iquest process per
+         query. `native` runs queries in-process through python-irodsclient,
+         over one session per module run, using the iRODS environment file of
+         `become_user`. `auto` uses `native` when python-irodsclient is
+         available and falls back to `iquest` otherwise."
+    required: false
+    type: str
+    choices: [auto, iquest, native]
+    default: auto
+  catalog_cache_ttl:
+    description:
+      - "Lifetime in seconds of the catalog snapshots cached on the managed
+         host. Queries already cached by a previous task are then served from
+         a local file instead of the catalog. `0` disables the cache."
+      - "Any write done by a module of this collection drops the cache. Other
+         catalog changes are only seen once cached snapshots expire."
+    required: false
+    type: int
+    default: 0
+  catalog_cache_dir:
+    description: directory where catalog snapshots are cached
+    required: false
+    type: path
+    default: ~/.cache/mcia_irods/catalog
+
+requirements:
+  - "python-irodsclient (optional, for `query_backend: native`)"
+'''
+
+    # options shared by all modules
+    TRACE = r'''
+options:
+  timings:
+    description:
+      - "Returns the spans recorded during the module run in the `timings`
+         key of the result: one span per iRODS command (iquest, iadmin,
+         irule...) with its duration, return code and output size, and one
+         span per parsing or comparison phase."
+    required: false
+    type: bool
+    default: false
+  trace_file:
+    description:
+      - "Path of a file on the managed host where the spans recorded during
+         the module run are appended as JSON lines."
+    required: false
+    type: path
+'''
+
+    # options of the modules returning a diff of catalog entries
+    DIFF = r'''
+options:
+  diff_mode:
+    description:
+      - "How the diff is rendered in `--diff` mode. `changed` only shows the
+         changed entries and `diff_context` entries around each of them.
+         `full` shows all compared entries. `summary` only returns the
+         number of entries added, removed, modified and left unchanged."
+    required: false
+    type: str
+    choices: [changed, full, summary]
+    default: changed
+  diff_context:
+    description: number of unchanged entries shown around each changed entry
+    required: false
+    type: int
+    default: 1
+  diff_max_size:
+    description:
+      - "Maximum size in characters of each side of the diff. Entries past
+         this size are counted but not shown. `0` disables the limit."
+    required: false
+    type: int
+    default: 65536
+'''
+
+    # options of the modules checking iRODS passwords
+    AUTH = r'''
+options:
+  auth_backend:
+    description:
+      - "How passwords are checked. `icommands` runs iinit, or a one-row
+         iquest query to check an existing password file. `native`
+         authenticates in-process through python-irodsclient, without
+         temporary files nor child processes, using PAM over SSL with
+         `irods_version: 4.3` and `ssl`. `auto` uses `native` when
+         python-irodsclient is available and falls back to `icommands`
+         otherwise."
+    required: false
+    type: str
+    choices: [auto, icommands, native]
+    default: auto
+
+requirements:
+  - "python-irodsclient (optional, for `auth_backend: native`)"
+'''
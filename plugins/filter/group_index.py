@@ -0,0 +1,59 @@
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+
+from ansible.errors import AnsibleFilterError
+
+from ansible_collections.mcia.irods.plugins.module_utils.irods_utils import (
+    UserGroups,
+)
+
+
+def _index(groups):
+    if not isinstance(groups, dict):
+        raise AnsibleFilterError('groups must be a dictionary')
+
+    if UserGroups.is_index(groups):
+        # already indexed
+        return groups
+
+    return UserGroups.from_dict(groups).to_dict()
+
+
+def group_index(groups):
+    '''
+    Indexes group memberships given as a dictionary of member lists by group
+    name.
+
+    Returns a dictionary with `groups` (members by group), `users` (groups by
+    user) and `counts` keys, so that lookups on both sides need no scan.
+    '''
+    return _index(groups)
+
+
+def user_groups(groups, user):
+    '''
+    Returns the groups of user, from a group_index result or a dictionary of
+    member lists by group name.
+    '''
+    return _index(groups)['users'].get(user, [])
+
+
+def group_members(groups, group):
+    '''
+    Returns the members of group, from a group_index result or a dictionary
+    of member lists by group name.
+    '''
+    return _index(groups)['groups'].get(group, [])
+
+
+# ---- Ansible filters ----
+class FilterModule(object):
+    ''' iRODS group membership filters '''
+
+    def filters(self):
+        return {
+            'group_index': group_index,
+            'user_groups': user_groups,
+            'group_members': group_members,
+        }
@@ -2,11 +2,42 @@
 from __future__ import (absolute_import, division, print_function)
 __metaclass__ = type
 
+import atexit
+import functools
+import hashlib
+import heapq
+import json
 import os.path
 import os
-
+import re
+import shlex
+import shutil
+import ssl
+import subprocess
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from fnmatch import fnmatch
-from tempfile import mkstemp
+from tempfile import mkstemp, TemporaryFile
+
+try:
+    import irods.exception
+    import irods.models
+    from irods import password_obfuscation
+    from irods.column import Criterion
+    from irods.exception import CAT_NO_ROWS_FOUND
+    from irods.session import iRODSSession
+    HAS_IRODSCLIENT = True
+except ImportError:
+    HAS_IRODSCLIENT = False
+
+try:
+    # `in` conditions are only supported by recent python-irodsclient
+    from irods.column import In
+except ImportError:
+    In = None
 
 
 # iRODS resource hierarchy description fields
@@ -65,6 +96,311 @@ _USER_GROUP_FIELDS = [
     'USER_GROUP_NAME',
 ]
 
+_GROUP_MEMBER_FIELDS = [
+    'USER_NAME',
+    'USER_ZONE',
+    'USER_GROUP_NAME',
+]
+
+_USER_FIELDS = [
+    'USER_ID',
+    'USER_NAME',
+    'USER_TYPE',
+    'USER_ZONE',
+    'USER_INFO',
+    'USER_COMMENT',
+]
+
+_MODUSER_ATTR_NAME = {
+    'USER_ZONE': 'zone',
+    'USER_TYPE': 'type',
+    'USER_COMMENT': 'comment',
+    'USER_INFO': 'info',
+}
+
+# GenQuery fields returned as integers, other fields are strings
+_INT_FIELDS = set([
+    'ZONE_ID',
+    'RESC_ID',
+    'USER_ID',
+    'QUOTA_RESC_ID',
+    'QUOTA_LIMIT',
+    'QUOTA_OVER',
+])
+
+
+# options shared by the modules reading the iRODS catalog
+def irods_common_argument_spec():
+    spec = dict(
+        query_backend=dict(
+            type='str',
+            default='auto',
+            required=False,
+            choices=['auto', 'iquest', 'native'],
+        ),
+        catalog_cache_ttl=dict(type='int', default=0, required=False),
+        catalog_cache_dir=dict(
+            type='path',
+            default='~/.cache/mcia_irods/catalog',
+            required=False,
+        ),
+    )
+    spec.update(irods_trace_argument_spec())
+
+    return spec
+
+
+# options of the modules checking iRODS passwords
+def irods_auth_argument_spec():
+    return dict(
+        auth_backend=dict(
+            type='str',
+            default='auto',
+            required=False,
+            choices=['auto', 'icommands', 'native'],
+        ),
+    )
+
+
+# options shared by all modules
+def irods_trace_argument_spec():
+    return dict(
+        timings=dict(type='bool', default=False, required=False),
+        trace_file=dict(type='path', required=False),
+    )
+
+
+# spans recorded during the module run, see instrument_module()
+_trace = dict(spans=None, start=None)
+
+
+@contextmanager
+def trace_span(name, kind='phase', **attrs):
+    '''Records the duration of the enclosed block as a span
+
+    The yielded dict holds the span attributes and can be updated by the
+    block. Nothing is recorded unless the module is instrumented.
+    '''
+    spans = _trace['spans']
+
+    if spans is None:
+        yield attrs
+        return
+
+    start = time.time()
+    t = time.perf_counter()
+    try:
+        yield attrs
+    finally:
+        attrs.update(
+            name=name,
+            kind=kind,
+            start=round(start - _trace['start'], 6),
+            duration=round(time.perf_counter() - t, 6),
+        )
+        spans.append(attrs)
+
+
+def traced(func):
+    '''Records a phase span for each call of func
+    '''
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with trace_span(func.__name__):
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+def _redact(module, args):
+    '''Masks no_log values (passwords) in a command line
+    '''
+    for secret in getattr(module, 'no_log_values', ()):
+        if secret:
+            args = [a.replace(secret, '********') for a in args]
+
+    return args
+
+
+def instrument_module(module):
+    '''Records a span for every command run by the module, if its `timings`
+    or `trace_file` options are set
+
+    Spans are returned as the `timings` key of the module result when
+    `timings` is set, and appended as JSON lines to `trace_file` when given.
+    '''
+    if not (module.params.get('timings') or module.params.get('trace_file')):
+        return
+
+    _trace.update(spans=[], start=time.time())
+
+    run_command = module.run_command
+
+    def timed_run_command(args, *a, **kw):
+        cmdline = shlex.split(args) if isinstance(args, str) else list(args)
+
+        with trace_span(os.path.basename(cmdline[0]), 'command',
+                        args=_redact(module, cmdline[1:])) as span:
+            r, o, e = run_command(args, *a, **kw)
+            span.update(rc=r, bytes=len(o or '') + len(e or ''))
+
+        return r, o, e
+
+    def finishing(exit):
+        def wrapper(**kwargs):
+            _finish_trace(module, kwargs)
+            exit(**kwargs)
+
+        return wrapper
+
+    module.run_command = timed_run_command
+    module.exit_json = finishing(module.exit_json)
+    module.fail_json = finishing(module.fail_json)
+
+
+def _finish_trace(module, result):
+    spans, _trace['spans'] = _trace['spans'], None
+
+    if spans is None:
+        return
+
+    if module.params.get('timings'):
+        result['timings'] = spans
+
+    trace_file = module.params.get('trace_file')
+    if not trace_file:
+        return
+
+    run = dict(
+        module=getattr(module, '_name', None),
+        pid=os.getpid(),
+        time=_trace['start'],
+    )
+
+    try:
+        with open(os.path.expanduser(trace_file), 'a') as f:
+            for span in spans:
+                f.write(json.dumps(dict(run, **span)) + '\n')
+    except (OSError, TypeError, ValueError) as e:
+        module.warn('could not write trace file %s: %s' % (trace_file, e))
+
+
+# options of the modules returning a diff of catalog entries
+def irods_diff_argument_spec():
+    return dict(
+        diff_mode=dict(
+            type='str',
+            default='changed',
+            required=False,
+            choices=['changed', 'full', 'summary'],
+        ),
+        diff_context=dict(type='int', default=1, required=False),
+        diff_max_size=dict(type='int', default=65536, required=False),
+    )
+
+
+def diff_summary(before, after):
+    '''Counts the entries added, removed, modified and left unchanged
+    between the before and after dicts
+    '''
+    counts = dict(added=0, removed=0, modified=0, unchanged=0)
+
+    for k, v in before.items():
+        if k not in after:
+            counts['removed'] += 1
+        elif after[k] != v:
+            counts['modified'] += 1
+        else:
+            counts['unchanged'] += 1
+
+    counts['added'] = len(after) - counts['modified'] - counts['unchanged']
+
+    return counts
+
+
+def _diff_shown(changed, count, context):
+    '''Returns the sorted indexes of entries within context of a changed
+    entry index
+    '''
+    shown = []
+    for i in changed:
+        start = max(i - context, shown[-1] + 1 if shown else 0)
+        shown.extend(range(start, min(i + context + 1, count)))
+
+    return shown
+
+
+def render_diff(module, before, after, order=None):
+    '''Returns the `diff` of the before and after entries, dicts of text
+    lines keyed by entry
+
+    With `diff_mode: changed`, only changed entries and `diff_context`
+    entries around them are rendered, `full` renders all entries and
+    `summary` only counts entries per change type. Entries are rendered in
+    the given key order, sorted keys by default, and rendering stops once
+    a side reaches `diff_max_size` characters.
+    '''
+    mode = module.params.get('diff_mode') or 'full'
+
+    if mode == 'summary':
+        counts = diff_summary(before, after)
+        return dict(prepared=''.join(
+            '%s: %d\n' % (k, counts[k])
+            for k in ('added', 'removed', 'modified', 'unchanged')
+        ))
+
+    if order is None:
+        order = sorted(set(before) | set(after))
+
+    if mode == 'full':
+        shown = range(len(order))
+    else:
+        changed = [
+            i for i, k in enumerate(order) if before.get(k) != after.get(k)
+        ]
+        shown = _diff_shown(changed, len(order),
+                            max(module.params.get('diff_context') or 0, 0))
+
+    max_size = module.params.get('diff_max_size') or 0
+    out_before, out_after = [], []
+    size_before = size_after = 0
+    last = -1
+
+    for n, i in enumerate(shown):
+        if max_size and max(size_before, size_after) >= max_size:
+            left = sum(
+                1 for j in shown[n:]
+                if before.get(order[j]) != after.get(order[j])
+            )
+            line = '... diff truncated, %d changed entries not shown\n' % left
+            out_before.append(line)
+            out_after.append(line)
+            break
+
+        if i > last + 1:
+            line = '... %d unchanged entries\n' % (i - last - 1)
+            out_before.append(line)
+            out_after.append(line)
+
+        last = i
+        k = order[i]
+
+        if k in before:
+            out_before.append(before[k] + '\n')
+            size_before += len(out_before[-1])
+
+        if k in after:
+            out_after.append(after[k] + '\n')
+            size_after += len(out_after[-1])
+    else:
+        if last < len(order) - 1:
+            line = '... %d unchanged entries\n' % (len(order) - last - 1)
+            out_before.append(line)
+            out_after.append(line)
+
+    return dict(before=''.join(out_before), after=''.join(out_after))
+
+
 class IrodsCommand:
 
     def __init__(self, cmd_prefix=''):
@@ -94,11 +430,753 @@ class IrodsAdmin(IrodsCommand):
         return 'iadmin'
 
 
+# prompt printed by iadmin before reading each interactive command
+_IADMIN_PROMPT = 'iadmin>'
+
+# iRODS error messages as printed by icommands
+_IRODS_ERROR_RE = re.compile(r'(^|\s)(ERROR|Error):|-\d{4,}\s+[A-Z][A-Z0-9_]+')
+
+
+def _iadmin_quote(arg):
+    '''Quotes an argument for the iadmin interactive mode tokenizer
+
+    Raises ValueError for arguments the tokenizer cannot read back, it has
+    no escapes.
+    '''
+    if '\n' in arg:
+        raise ValueError('newline in iadmin argument')
+
+    if arg and not set(arg) & set(' \t\'"'):
+        return arg
+
+    if '\'' not in arg:
+        return '\'' + arg + '\''
+
+    if '"' not in arg:
+        return '"' + arg + '"'
+
+    raise ValueError('both quote characters in iadmin argument')
+
+
+def _iadmin_line(cmdline):
+    '''Returns the interactive mode line of cmdline, None if it cannot be
+    quoted
+    '''
+    try:
+        return ' '.join([_iadmin_quote(a) for a in cmdline])
+    except ValueError:
+        return None
+
+
+class IrodsAdminSession:
+    '''Runs a batch of iadmin commands through one interactive iadmin process
+
+    Commands are iadmin argument lists, with or without the iadmin command
+    path as built by IrodsAdmin. They are streamed to iadmin stdin so that the
+    whole batch costs a single process and a single iCAT authentication.
+
+    Note that, unlike separate iadmin runs, iadmin goes on with the next
+    commands after a failed one. Commands depending on previous ones have to
+    follow a barrier(): they are run by another iadmin process, only if all
+    the previous ones succeeded. Commands whose arguments cannot be quoted
+    for the interactive mode are run alone, the same way.
+    '''
+
+    def __init__(self, module, cmd_prefix='', threaded=False):
+        self.module = module
+        self.iadmin = IrodsAdmin(cmd_prefix)
+        self.commands = []
+        self.barriers = set()
+        # run_command() is not thread safe, it changes the process environment
+        if threaded:
+            self.run_command = functools.partial(run_process, module)
+        else:
+            self.run_command = module.run_command
+
+    def add(self, cmdline):
+        if cmdline and cmdline[0] == self.iadmin._command_path():
+            cmdline = cmdline[1:]
+
+        self.commands.append(list(cmdline))
+
+    def barrier(self):
+        '''Runs the next commands only if all the previous ones succeed
+        '''
+        if self.commands:
+            self.barriers.add(len(self.commands))
+
+    def __len__(self):
+        return len(self.commands)
+
+    def _runs(self, commands, barriers):
+        '''Splits commands in (interactive lines, commands) runs, lines are
+        None for commands run alone
+        '''
+        runs = []
+
+        for i, c in enumerate(commands):
+            line = _iadmin_line(c)
+
+            if line is None:
+                runs.append((None, [c]))
+            elif i in barriers or not runs or runs[-1][0] is None:
+                runs.append(([line], [c]))
+            else:
+                runs[-1][0].append(line)
+                runs[-1][1].append(c)
+
+        return runs
+
+    def execute(self, ignore_errors=()):
+        '''Runs the batched commands without failing the module
+
+        Returns a (results, error) tuple where results is a list of (command
+        line, output) tuples, one per command run successfully until the first
+        error, and error is None or the message of the first error. Errors
+        whose message contains one of `ignore_errors` names are tolerated.
+        '''
+        if not self.commands:
+            return [], None
+
+        commands, self.commands = self.commands, []
+        barriers, self.barriers = self.barriers, set()
+
+        invalidate_catalog_cache(self.module)
+
+        results = []
+        for lines, run in self._runs(commands, barriers):
+            if lines is None:
+                r, error = self._execute_alone(run[0], ignore_errors)
+            else:
+                r, error = self._execute_lines(lines, run, ignore_errors)
+
+            results += r
+
+            if error is not None:
+                return results, error
+
+        return results, None
+
+    def _execute_alone(self, c, ignore_errors):
+        cmdline = self.iadmin(c)
+
+        r, o, e = self.run_command(cmdline)
+
+        if r != 0 and not any(err in o + e for err in ignore_errors):
+            return [], (
+                'iadmin cmd=\'%s\' failed with code=%s error=\'%s\'' %
+                (' '.join(_redact(self.module, cmdline)), r, (o + e).strip())
+            )
+
+        return [(' '.join(cmdline), (o + e).strip())], None
+
+    def _execute_lines(self, lines, commands, ignore_errors):
+        script = '\n'.join(lines + ['quit'])
+
+        # merge stderr so that error messages follow their command prompt,
+        # which iadmin prints to stdout, block buffered through a pipe
+        cmd = shlex.quote(self.iadmin._command_path()) + ' 2>&1'
+        stdbuf = shutil.which('stdbuf')
+        if stdbuf is not None:
+            cmd = shlex.quote(stdbuf) + ' -o0 ' + cmd
+
+        with trace_span('iadmin_session', 'batch', commands=[
+            ' '.join(_redact(self.module, c)) for c in commands
+        ]):
+            r, o, e = self.run_command(cmd, data=script,
+                                       use_unsafe_shell=True)
+
+        # the first chunk is printed before any prompt, errors there cannot
+        # be told apart, if any is not ignored the whole run failed
+        chunks = o.split(_IADMIN_PROMPT)
+        failed = False
+        for line in (chunks[0] + '\n' + e).splitlines():
+            if not _IRODS_ERROR_RE.search(line):
+                continue
+
+            if not any(err in line for err in ignore_errors):
+                return [], (
+                    'iadmin batch failed with error=\'%s\'' %
+                    (chunks[0] + e).strip()
+                )
+
+            failed = True
+
+        outputs = chunks[1:len(commands) + 1]
+        outputs += [''] * (len(commands) - len(outputs))
+
+        results = []
+        for c, out in zip(commands, outputs):
+            cmdline = ' '.join(self.iadmin(c))
+
+            if _IRODS_ERROR_RE.search(out):
+                if not any(err in out for err in ignore_errors):
+                    return results, (
+                        'iadmin cmd=\'%s\' failed with error=\'%s\'' %
+                        (cmdline, out.strip())
+                    )
+
+                failed = True
+
+            results.append((cmdline, out.strip()))
+
+        if r != 0 and not failed:
+            return results, (
+                'iadmin batch failed with code=%s error=\'%s\'' %
+                (r, o.strip() or e)
+            )
+
+        return results, None
+
+    def run(self, ignore_errors=()):
+        '''Runs the batched commands, fails the module on the first error
+
+        Returns a list of (command line, output) tuples, one per command.
+        '''
+        results, error = self.execute(ignore_errors)
+
+        if error is not None:
+            self.module.fail_json(msg=error, results=results)
+
+        return results
+
+
+def run_iadmin_batch(module, cmdlines, ignore_errors=()):
+    session = IrodsAdminSession(module)
+
+    for cmdline in cmdlines:
+        session.add(cmdline)
+
+    return session.run(ignore_errors)
+
+
+# iadmin operations on a parent/child link: links of a same parent can be
+# changed concurrently, the parent is only shared by these operations
+_RESC_LINK_OPERATIONS = set([
+    'rmchildfromresc',
+    'addchildtoresc',
+])
+
+
+def operation_waves(operations):
+    '''Splits a list of iadmin resource operations in waves
+
+    Each operation depends on the previous operations of the list touching
+    any of its resources, except for link operations sharing a parent.
+    Operations of a wave only depend on operations of previous waves, so that
+    running the waves in order, each wave in any order, has the same outcome
+    as running the list in order.
+    '''
+    waves = []
+    last_exclusive = {}
+    last_use = {}
+
+    for op in operations:
+        if op[0] in _RESC_LINK_OPERATIONS:
+            shared, exclusive = op[1:2], op[2:3]
+        else:
+            shared, exclusive = [], op[1:2]
+
+        wave = max(
+            [last_use.get(n, -1) for n in exclusive] +
+            [last_exclusive.get(n, -1) for n in shared] +
+            [-1]
+        ) + 1
+
+        for n in exclusive:
+            last_exclusive[n] = wave
+        for n in shared + exclusive:
+            last_use[n] = max(last_use.get(n, -1), wave)
+
+        if wave == len(waves):
+            waves.append([])
+
+        waves[wave].append(op)
+
+    return waves
+
+
+def run_iadmin_waves(module, waves, concurrency=1, ignore_errors=()):
+    '''Runs waves of independent iadmin operations one after the other
+
+    Each wave is split among up to `concurrency` iadmin sessions running in
+    parallel. Fails the module after the wave where an operation failed.
+    '''
+    results = []
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        for wave in waves:
+            size = -(-len(wave) // max(1, concurrency))
+
+            sessions = []
+            for i in range(0, len(wave), size):
+                session = IrodsAdminSession(module, threaded=True)
+                for op in wave[i:i + size]:
+                    session.add(op)
+                sessions.append(session)
+
+            futures = [pool.submit(s.execute, ignore_errors) for s in sessions]
+
+            errors = []
+            for f in futures:
+                r, error = f.result()
+                results += r
+
+                if error is not None:
+                    errors.append(error)
+
+            if errors:
+                module.fail_json(msg='; '.join(errors), results=results)
+
+    return results
+
+
+def genquery(fields, where=()):
+    '''Builds a GenQuery string from a list of fields and a list of
+    (field, operator, value) conditions
+
+    The value of `in` conditions is a list of values.
+    '''
+    cmd = 'select ' + ', '.join(fields)
+
+    where_clauses = [
+        '%s in (%s)' % (w[0], ', '.join(['\'%s\'' % v for v in w[2]]))
+        if w[1] == 'in' else '%s %s \'%s\'' % w
+        for w in where
+    ]
+    if where_clauses:
+        cmd += ' where ' + ' and '.join(where_clauses)
+
+    return cmd
+
+
+# separator of the fields printed by iquest, catalog names and AVUs may
+# hold ':' but no control character
+_IQUEST_SEPARATOR = '\x1f'
+
+
+def typed_row(fields, values):
+    row = {}
+
+    for k, v in zip(fields, values):
+        if v is None:
+            v = ''
+        elif k in _INT_FIELDS and v != '':
+            v = int(v)
+
+        row[k] = v
+
+    return row
+
+
+def command_env(module):
+    '''Returns the environment of commands run outside run_command(), with
+    the locale variables run_command() would set
+    '''
+    env = os.environ.copy()
+    env.update(getattr(module, 'run_command_environ_update', None) or {})
+
+    return env
+
+
+def run_process(module, args, data=None, use_unsafe_shell=False):
+    '''Runs a command like run_command(), without changing the process
+    environment so that it can be called from worker threads
+
+    Returns a (rc, stdout, stderr) tuple.
+    '''
+    try:
+        p = subprocess.Popen(args, shell=use_unsafe_shell,
+                             env=command_env(module), stdin=subprocess.PIPE,
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                             encoding='utf-8', errors='surrogateescape')
+    except OSError as e:
+        return 127, '', str(e)
+
+    # like run_command(), data is sent with a trailing newline
+    o, e = p.communicate(None if data is None else data + '\n')
+
+    return p.returncode, o, e
+
+
 class IrodsQuest(IrodsCommand):
 
     def _command(self):
         return 'iquest'
 
+    def select(self, module, fields, where=()):
+        '''Runs a GenQuery selection, returns a list of rows
+
+        Rows are dicts indexed by field names, see typed_row().
+        '''
+        return list(self.iter_select(module, fields, where))
+
+    def iter_select(self, module, fields, where=()):
+        '''Runs a GenQuery selection, yields rows while iquest prints them
+
+        Only the row being parsed is held in memory, so that callers can
+        build the index they need over large selections.
+        '''
+        fmt = _IQUEST_SEPARATOR.join(['%s'] * len(fields))
+        cmd = genquery(fields, where)
+        args = self(['--no-page', fmt, cmd])
+
+        no_rows = False
+
+        with TemporaryFile(mode='w+', encoding='utf-8',
+                           errors='surrogateescape') as err, \
+                trace_span(self._command(), 'command', args=args[1:]) as span:
+            try:
+                p = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=err,
+                                     env=command_env(module),
+                                     encoding='utf-8', errors='surrogateescape')
+            except OSError as e:
+                module.fail_json(
+                    msg='iquest cmd=\'%s\' failed: %s' % (cmd, e)
+                )
+
+            span['bytes'] = 0
+            try:
+                for l in p.stdout:
+                    span['bytes'] += len(l)
+
+                    if 'CAT_NO_ROWS_FOUND' in l:
+                        no_rows = True
+                    elif l.strip():
+                        yield parse_iquest_line(l, fields, _IQUEST_SEPARATOR)
+            finally:
+                p.stdout.close()
+                r = span['rc'] = p.wait()
+
+            err.seek(0)
+            e = err.read()
+
+        # iquest returns rc=1 for CAT_NO_ROWS_FOUND in non-interactive mode
+        if r in (0, 1) and (no_rows or 'CAT_NO_ROWS_FOUND' in e):
+            return
+
+        if r != 0:
+            module.fail_json(
+                msg='iquest cmd=\'%s\' failed with code=%s error=\'%s\'' %
+                (cmd, r, e)
+            )
+
+
+def parse_iquest_line(line, fields, separator=':'):
+    '''Parses one line of iquest output printed with a `separator`
+    separated format
+    '''
+    return typed_row(fields,
+                     line.strip('\r\n').split(separator, len(fields) - 1))
+
+
+# python-irodsclient session shared by all native queries of a module run
+_native = dict(session=None, failed=False, lock=threading.Lock())
+
+
+def irods_environment_file():
+    return os.environ.get(
+        'IRODS_ENVIRONMENT_FILE',
+        os.path.expanduser('~/.irods/irods_environment.json')
+    )
+
+
+def _native_session():
+    with _native['lock']:
+        if _native['session'] is None:
+            _native['session'] = _new_native_session()
+
+    return _native['session']
+
+
+def _new_native_session():
+    env_file = irods_environment_file()
+
+    with open(env_file) as f:
+        env = json.load(f)
+
+    kwargs = {}
+    if env.get('irods_client_server_policy') == 'CS_NEG_REQUIRE':
+        kwargs['ssl_context'] = ssl.create_default_context(
+            purpose=ssl.Purpose.SERVER_AUTH,
+            cafile=env.get('irods_ssl_ca_certificate_file'),
+        )
+
+    session = iRODSSession(irods_env_file=env_file, **kwargs)
+    atexit.register(session.cleanup)
+
+    return session
+
+
+def _native_columns():
+    '''Maps GenQuery field names to python-irodsclient columns
+    '''
+    columns = {}
+
+    for name in dir(irods.models):
+        for col in getattr(getattr(irods.models, name), '_columns', []):
+            columns.setdefault(col.icat_key, col)
+
+    return columns
+
+
+class IrodsNativeQuest(IrodsQuest):
+    '''Runs GenQuery selections in-process with python-irodsclient
+
+    Selections on fields unknown to python-irodsclient fall back to iquest,
+    so does everything after a session failure unless `required` is set.
+    '''
+
+    def __init__(self, cmd_prefix='', required=False):
+        IrodsQuest.__init__(self, cmd_prefix)
+        self.required = required
+
+    def iter_select(self, module, fields, where=()):
+        if _native['failed']:
+            for row in IrodsQuest.iter_select(self, module, fields, where):
+                yield row
+            return
+
+        columns = _native_columns()
+
+        if (not all(f in columns for f in fields + [w[0] for w in where])
+                or (In is None and any(w[1] == 'in' for w in where))):
+            for row in IrodsQuest.iter_select(self, module, fields, where):
+                yield row
+            return
+
+        cols = [columns[f] for f in fields]
+
+        # python-irodsclient fetches results page by page
+        started = False
+        try:
+            with trace_span('python-irodsclient', 'query',
+                            query=genquery(fields, where), rows=0) as span:
+                query = _native_session().query(*cols)
+                for field, op, value in where:
+                    if op == 'in':
+                        query = query.filter(In(columns[field], value))
+                    else:
+                        query = query.filter(
+                            Criterion(op, columns[field], value)
+                        )
+
+                for row in query:
+                    started = True
+                    span['rows'] += 1
+                    yield typed_row(fields, [row[c] for c in cols])
+
+            return
+        except CAT_NO_ROWS_FOUND:
+            return
+        except Exception as e:
+            if self.required or started:
+                module.fail_json(
+                    msg='native query \'%s\' failed: %s' %
+                    (genquery(fields, where), e)
+                )
+
+            _native['failed'] = True
+
+        for row in IrodsQuest.iter_select(self, module, fields, where):
+            yield row
+
+
+def irods_quest(module):
+    '''Returns the GenQuery backend selected by the `query_backend` option
+    '''
+    backend = module.params.get('query_backend') or 'iquest'
+
+    if backend == 'native' and not HAS_IRODSCLIENT:
+        module.fail_json(
+            msg='python-irodsclient is required for query_backend=native'
+        )
+
+    if backend == 'iquest' or not HAS_IRODSCLIENT:
+        quest = IrodsQuest()
+    else:
+        quest = IrodsNativeQuest(required=(backend == 'native'))
+
+    cache = catalog_cache(module)
+    if cache is not None and cache.ttl > 0:
+        return IrodsCachedQuest(quest, cache)
+
+    return quest
+
+
+# longest `in` condition of a GenQuery, iquest rejects longer query strings
+_GENQUERY_IN_MAX_LEN = 1024
+
+# above that many pushed down queries, a single full scan is cheaper
+_GENQUERY_IN_MAX_QUERIES = 8
+
+
+def in_chunks(values, max_len=_GENQUERY_IN_MAX_LEN):
+    '''Splits values into lists whose GenQuery `in` condition is at most
+    max_len characters long
+    '''
+    chunks = []
+    chunk, size = [], 0
+
+    for v in values:
+        # quotes and separator
+        length = len(v) + 4
+
+        if chunk and size + length > max_len:
+            chunks.append(chunk)
+            chunk, size = [], 0
+
+        chunk.append(v)
+        size += length
+
+    if chunk:
+        chunks.append(chunk)
+
+    return chunks
+
+
+def select_in(module, fields, field, values, where=(),
+              max_queries=_GENQUERY_IN_MAX_QUERIES):
+    '''Yields the rows of a GenQuery selection whose `field` is one of values
+
+    Values are pushed down to the catalog as `field in (...)` conditions,
+    split into queries of bounded length. When they would need more than
+    max_queries queries, or cannot be quoted, the selection is run once
+    without them and filtered locally instead.
+
+    With max_queries None, for selections too large to scan, the selection
+    is never run without conditions: values that cannot be quoted are
+    matched one `like` query each, the quote being the `_` wildcard.
+    '''
+    quest = irods_quest(module)
+    values = sorted(set(values))
+    quoted = [v for v in values if '\'' not in v]
+
+    chunks = None
+    if max_queries is None or len(quoted) == len(values):
+        chunks = in_chunks(quoted)
+
+    if chunks is None or (max_queries is not None and
+                          len(chunks) > max_queries):
+        values = set(values)
+
+        for row in quest.iter_select(module, fields, where):
+            if row[field] in values:
+                yield row
+        return
+
+    for chunk in chunks:
+        for row in quest.iter_select(module, fields,
+                                     list(where) + [(field, 'in', chunk)]):
+            yield row
+
+    for v in values:
+        if '\'' not in v:
+            continue
+
+        for row in quest.iter_select(
+                module, fields,
+                list(where) + [(field, 'like', v.replace('\'', '_'))]):
+            if row[field] == v:
+                yield row
+
+
+class CatalogCache:
+    '''On-host snapshot cache of catalog query results
+
+    Entries are JSON files keyed by zone and GenQuery string, and expire
+    after `ttl` seconds. Any catalog write done by this collection drops the
+    whole cache (see invalidate_catalog_cache()), writes done by other means
+    are only caught up by expiration.
+    '''
+
+    def __init__(self, path, ttl, zone=None):
+        self.path = path
+        self.ttl = ttl
+        self.zone = zone or '_default'
+
+    def _file(self, key):
+        h = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.path, self.zone, h + '.json')
+
+    def get(self, key):
+        path = self._file(key)
+
+        try:
+            if os.path.getmtime(path) + self.ttl < time.time():
+                return None
+
+            with open(path) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if entry.get('key') != key:
+            return None
+
+        return entry['value']
+
+    def put(self, key, value):
+        path = self._file(key)
+
+        try:
+            os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+
+            fd, tmp = mkstemp(dir=os.path.dirname(path))
+            with os.fdopen(fd, 'w') as f:
+                json.dump(dict(key=key, value=value), f)
+
+            os.rename(tmp, path)
+        except OSError:
+            # the cache is an optimization only
+            pass
+
+    def invalidate(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+def catalog_cache(module):
+    path = module.params.get('catalog_cache_dir')
+    if not path:
+        return None
+
+    return CatalogCache(
+        os.path.expanduser(path),
+        module.params.get('catalog_cache_ttl') or 0,
+        module.params.get('zone'),
+    )
+
+
+def invalidate_catalog_cache(module):
+    '''Drops the catalog snapshot cache, has to be called before any write
+    '''
+    cache = catalog_cache(module)
+    if cache is not None:
+        cache.invalidate()
+
+
+class IrodsCachedQuest:
+    '''Serves GenQuery selections from a CatalogCache, falling back to the
+    wrapped backend
+    '''
+
+    def __init__(self, quest, cache):
+        self.quest = quest
+        self.cache = cache
+
+    def select(self, module, fields, where=()):
+        return list(self.iter_select(module, fields, where))
+
+    def iter_select(self, module, fields, where=()):
+        key = genquery(fields, where)
+
+        rows = self.cache.get(key)
+        if rows is None:
+            rows = self.quest.select(module, fields, where)
+            self.cache.put(key, rows)
+
+        return iter(rows)
+
 
 class IrodsRule(IrodsCommand):
 
@@ -145,146 +1223,182 @@ def ienv(module):
 
 
 def get_zones(module, **args):
-    iquest = IrodsQuest()
+    return irods_quest(module).select(
+        module,
+        _ZONE_FIELDS,
+        [(k, '=', v) for k, v in args.items()],
+    )
 
-    fmt = ':'.join(['%s'] * len(_ZONE_FIELDS))
 
-    cmd = 'select ' + ', '.join(_ZONE_FIELDS)
-    where_clauses = ['%s = \'%s\'' % a for a in args.items()]
-    if where_clauses:
-        cmd += ' where ' + ' and '.join(where_clauses)
+def zone_where(module, field):
+    if module.params['zone'] is not None:
+        return [(field, '=', module.params['zone'])]
 
-    r, o, e = module.run_command(iquest(['--no-page', fmt, cmd]))
+    return []
 
-    if r != 0:
-        module.fail_json(
-            msg='iquest cmd=\'%s\' failed with code=%s error=\'%s\'' %
-            (cmd, r, e)
-        )
 
-    ret = []
-    for l in o.strip().split('\n'):
-        values = l.strip().split(':')
-        zone = dict(zip(_ZONE_FIELDS, values))
-        ret.append(zone)
+def rescs_id_name(module):
+    rows = irods_quest(module).iter_select(
+        module,
+        ['RESC_ID', 'RESC_NAME'],
+        zone_where(module, 'RESC_ZONE_NAME'),
+    )
+
+    return {r['RESC_ID']: r['RESC_NAME'] for r in rows}
+
 
-    return ret
+@traced
+def resc_trees(module):
+    rows = irods_quest(module).iter_select(
+        module,
+        _RESC_FIELDS,
+        zone_where(module, 'RESC_ZONE_NAME'),
+    )
 
+    return build_resc_trees(rows)
 
-def rescs_id_name(module):
-    iquest = IrodsQuest()
-    fields = ['RESC_ID', 'RESC_NAME']
 
-    fmt = ':'.join(['%s'] * len(fields))
+def build_resc_trees(rows):
+    '''Builds a RescForest from catalog rows of _RESC_FIELDS
+    '''
+    rescs = {}
+    parents = {}
 
-    cmd = 'select ' + ', '.join(fields)
-    if (module.params['zone'] is not None):
-        cmd += ' where RESC_ZONE_NAME = \'%s\'' % module.params['zone']
+    for row in rows:
+        # fields can't be deleted or set to empty string
+        # we emulate this with blank string
+        for k in _RESC_OPTIONAL_FIELDS:
+            if k in row and row[k].strip() == '':
+                row[k] = ''
 
-    r, o, e = module.run_command(iquest(['--no-page', fmt, cmd]))
+        if row['RESC_LOC'] == 'EMPTY_RESC_HOST':
+            row['RESC_LOC'] = None
 
-    if r != 0:
-        module.fail_json(
-            msg='iquest cmd=\'%s\' failed with code=%s error=\'%s\'' %
-            (cmd, r, e)
-        )
+        if row['RESC_VAULT_PATH'] == 'EMPTY_RESC_PATH':
+            row['RESC_VAULT_PATH'] = None
 
-    ret = {}
+        rescs[row['RESC_ID']] = RescNode(row)
+        parents[row['RESC_ID']] = row['RESC_PARENT']
 
-    for l in o.strip().split('\n'):
-        id, name = l.strip().split(':')
+    # build resc trees
+    forest = RescForest()
 
-        ret[int(id)] = name
+    for rid, resc in rescs.items():
+        if parents[rid] == '':
+            forest.roots.append(resc)
+            continue
 
-    return ret
+        parent = rescs[int(parents[rid])]
+        parent.children.append(resc)
+        resc.RESC_PARENT = parent.RESC_NAME
 
-def resc_trees(module):
-    iquest = IrodsQuest()
+    forest.sort()
 
-    fmt = ':'.join(['%s'] * len(_RESC_FIELDS))
+    return forest
 
-    cmd = 'select ' + ', '.join(_RESC_FIELDS)
-    if (module.params['zone'] is not None):
-        cmd += ' where RESC_ZONE_NAME = \'%s\'' % module.params['zone']
 
-    r, o, e = module.run_command(iquest(['--no-page', fmt, cmd]))
+# resource fields held by RescNode, besides hierarchy
+_RESC_NODE_FIELDS = _RESC_MANDATORY_FIELDS + _RESC_OPTIONAL_FIELDS
 
-    if r != 0:
-        module.fail_json(
-            msg='iquest cmd=\'%s\' failed with code=%s error=\'%s\'' %
-            (cmd, r, e)
-        )
+# fields identifying a resource: resources differing on them are recreated
+_RESC_KEY_FIELDS = [
+    'RESC_NAME',
+    'RESC_ZONE_NAME',
+    'RESC_TYPE_NAME',
+    'RESC_LOC',
+]
 
-    # build a resc dict and a list of root resc
-    rescs = {}
-    roots = set()
-    for l in o.strip().split('\n'):
-        values = l.strip().split(':')
-        resc = dict(zip(_RESC_FIELDS, values))
 
-        # fields can't be deleted or set to empty string
-        # we emulate this with blank string
-        for k in _RESC_OPTIONAL_FIELDS:
-            if k in resc and resc[k].strip() == '':
-                resc[k] = ''
+class RescNode:
+    '''iRODS resource in a RescForest
 
-        resc['children'] = []
+    Attributes are named after catalog fields. A None field is not set, or
+    matches anything in a wanted hierarchy. RESC_PARENT is the parent name.
+    '''
 
-        resc['RESC_ID'] = int(resc['RESC_ID'])
+    __slots__ = _RESC_NODE_FIELDS + ['RESC_PARENT', 'children']
 
-        if resc['RESC_LOC'] == 'EMPTY_RESC_HOST':
-            resc['RESC_LOC'] = None
+    def __init__(self, fields):
+        for k in _RESC_NODE_FIELDS:
+            setattr(self, k, fields.get(k))
 
-        if resc['RESC_VAULT_PATH'] == 'EMPTY_RESC_PATH':
-            resc['RESC_VAULT_PATH'] = None
+        self.RESC_PARENT = None
+        self.children = []
 
-        if resc['RESC_PARENT'] == '':
-            resc['RESC_PARENT'] = None
-        else:
-            resc['RESC_PARENT'] = int(resc['RESC_PARENT'])
+    def key(self):
+        '''Build a tuple to be used as a resc unique key from meaningful fields
+        '''
+        return tuple(getattr(self, k) for k in _RESC_KEY_FIELDS)
 
-        rescs[resc['RESC_ID']] = resc
+    def signature(self):
+        return (
+            tuple(getattr(self, k) for k in _RESC_NODE_FIELDS),
+            self.RESC_PARENT,
+            len(self.children),
+        )
 
-    # build resc trees
-    for r in list(rescs.values()):
+    def to_dict(self):
+        ret = {'RESC_PARENT': self.RESC_PARENT}
 
-        p_rid = r['RESC_PARENT']
+        for k in _RESC_NODE_FIELDS:
+            v = getattr(self, k)
+            if v is not None:
+                ret[k] = v
 
-        if p_rid is None:
-            roots.add(r['RESC_ID'])
-            continue
+        if self.children:
+            ret['children'] = [c.to_dict() for c in self.children]
+
+        return ret
 
-        parent = rescs[p_rid]
-        parent['children'].append(r)
-        r['RESC_PARENT'] = parent['RESC_NAME']
 
-    for r in list(rescs.values()):
-        clean_hierarchy(r)
+class RescForest:
+    '''Resource hierarchies, with resources indexed by name
 
-    return sorted([rescs[rid] for rid in roots], key=lambda r: r['RESC_NAME'])
+    Roots and children are sorted by name, see sort().
+    '''
 
+    def __init__(self):
+        self.roots = []
+        self.by_name = {}
 
-def clean_hierarchy(h):
-    for k in ['RESC_ID']:
-        if k in h:
-            del h[k]
+    def sort(self):
+        '''Sorts roots and children by name, and indexes resources
+        '''
+        self.roots.sort(key=lambda r: r.RESC_NAME)
+        self.by_name = {}
 
-    for k in ['RESC_LOC', 'RESC_VAULT_PATH']:
-        if k in h and h[k] is None:
-            del h[k]
+        for resc in self.nodes():
+            resc.children.sort(key=lambda r: r.RESC_NAME)
+            self.by_name[resc.RESC_NAME] = resc
 
-    if 'children' in h:
-        if h['children'] in ([], None):
-            del h['children']
-        else:
-            for c in h['children']:
-                clean_hierarchy(c)
+    def nodes(self):
+        '''Yields all resources, parents first
+        '''
+        stack = list(reversed(self.roots))
+
+        while stack:
+            resc = stack.pop()
+            yield resc
+            stack.extend(reversed(resc.children))
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, RescForest) and
+            [r.signature() for r in self.nodes()] ==
+            [r.signature() for r in other.nodes()]
+        )
+
+    def __ne__(self, other):
+        return not self == other
 
-            h['children'] = sorted(h['children'], key=lambda c: c['RESC_NAME'])
+    def to_dicts(self):
+        '''Returns resource trees as nested dicts, for module output
+        '''
+        return [r.to_dict() for r in self.roots]
 
 
-def param_to_resc(param, default_zone):
-    r = {
+def param_to_resc(param, default_zone, forest, parent=None):
+    r = RescNode({
         # _RESC_MANDATORY_FIELDS
         'RESC_NAME': param['name'],
         'RESC_ZONE_NAME': param.get('zone', default_zone),
@@ -297,233 +1411,207 @@ def param_to_resc(param, default_zone):
         'RESC_COMMENT': param.get('comment', '*'),
         'RESC_INFO': param.get('info', '*'),
         'RESC_CONTEXT': param.get('context', '*'),
+    })
 
+    if parent is None:
+        forest.roots.append(r)
+    else:
+        parent.children.append(r)
+        r.RESC_PARENT = parent.RESC_NAME
 
-        # hierarchy
-        'children': [],
-        'RESC_PARENT': None,
-    }
-
-    if 'children' in param:
-        for pc in param['children']:
-            c = param_to_resc(pc, default_zone)
-            r['children'].append(c)
-            c['RESC_PARENT'] = r['RESC_NAME']
-
-    return r
+    for pc in param.get('children') or []:
+        param_to_resc(pc, default_zone, forest, r)
 
 
+@traced
 def params_to_hierarchy(params_roots, default_zone):
-    roots = []
+    forest = RescForest()
 
     # FIXME: avoid multiple resources with identical names
     for pr in params_roots:
-        r = param_to_resc(pr, default_zone)
-        clean_hierarchy(r)
-        roots.append(r)
-
-    return sorted(roots, key=lambda c: c['RESC_NAME'])
-
-
-def match_hierarchy(match, reference_dict):
-    if match['RESC_NAME'] in reference_dict:
-        # compare match and reference resources
-        reference = reference_dict[match['RESC_NAME']]
-
-        for field in _RESC_OPTIONAL_FIELDS:
-            if field not in match:
-                if field in reference:
-                    match[field] = reference[field]
-
-                continue
-
-            ref_field = reference.get(field, '')
-            if fnmatch(ref_field, match[field]):
-                match[field] = ref_field
-    else:
-        # RESC_NAME not found in reference_dict, remove wildcards
-        for field in _RESC_OPTIONAL_FIELDS:
-            if field not in match:
-                continue
+        param_to_resc(pr, default_zone, forest)
 
-            if not (set(match[field]) - set('*?')):
-                # match[field] is a wildcard only field, remove it
-                del match[field]
+    forest.sort()
 
-    if 'children' in match:
-        for c in match['children']:
-            match_hierarchy(c, reference_dict)
+    return forest
 
 
+@traced
 def match_hierarchies(matchs, references):
-    def resc_dict(hier):
-        ret = {hier['RESC_NAME']: hier}
-
-        for c in hier.get('children', []):
-            ret.update(resc_dict(c))
-
-        return ret
-
-    def resc_dicts(hier_list):
-        ret = {}
-        for h in hier_list:
-            ret.update(resc_dict(h))
-
-        return ret
-
-    reference_dict = resc_dicts(references)
+    '''Resolves wildcards of `matchs` RescForest with the resources of the
+    same name in `references`
+    '''
+    for match in matchs.nodes():
+        reference = references.by_name.get(match.RESC_NAME)
+
+        if reference is not None:
+            # compare match and reference resources
+            for field in _RESC_OPTIONAL_FIELDS:
+                pattern = getattr(match, field)
+                ref_field = getattr(reference, field)
+
+                if pattern is None:
+                    setattr(match, field, ref_field)
+                elif fnmatch(ref_field or '', pattern):
+                    setattr(match, field, ref_field or '')
+        else:
+            # RESC_NAME not found in references, remove wildcards
+            for field in _RESC_OPTIONAL_FIELDS:
+                pattern = getattr(match, field)
 
-    for match in matchs:
-        match_hierarchy(match, reference_dict)
+                if pattern is not None and not (set(pattern) - set('*?')):
+                    # field is a wildcard only field, remove it
+                    setattr(match, field, None)
 
-def dump_hierarchy(hier, offest='  '):
-    ret = ':'.join([str(hier.get(k, '')) for k in _RESC_FIELDS]) + '\n'
 
-    if 'children' not in hier:
-        return ret
+def resc_line(hier):
+    return ':'.join([
+        '' if k == 'RESC_ID' else str(hier.RESC_PARENT)
+        if k == 'RESC_PARENT' else getattr(hier, k) or ''
+        for k in _RESC_FIELDS
+    ])
 
-    for child in hier['children']:
-        ret += offest + dump_hierarchy(child, offest + '  ') + '\n'
 
-    return ret
+def dump_hierarchy(hier, offset, out):
+    out.append(resc_line(hier) + '\n')
 
-def dump_hierarchies(hier_list):
-    ret = ''
-    for hier in hier_list:
-        ret += dump_hierarchy(hier)
+    for child in hier.children:
+        out.append(offset)
+        dump_hierarchy(child, offset + '  ', out)
+        out.append('\n')
 
-    return ret
 
+@traced
+def dump_hierarchies(forest):
+    out = []
+    for hier in forest.roots:
+        dump_hierarchy(hier, '  ', out)
 
-def compare_hierarchies(module, from_list, to_list):
-    def resc_key(resc):
-        '''Build a tuple to be used as a resc unique key from meaningful fields
-        '''
-        return tuple(resc.get(k, None) for k in [
-            'RESC_NAME',
-            'RESC_ZONE_NAME',
-            'RESC_TYPE_NAME',
-            'RESC_LOC',
-        ])
+    return ''.join(out)
 
-    def resc_dict(hier):
-        ret = {resc_key(hier): hier}
 
-        for c in hier.get('children', []):
-            ret.update(resc_dict(c))
+def hierarchy_lines(forest):
+    '''Returns the resource lines of the hierarchies keyed by resource name,
+    parents first and indented by depth, as entries for render_diff()
+    '''
+    lines = {}
+    stack = [(r, '') for r in reversed(forest.roots)]
 
-        return ret
+    while stack:
+        resc, offset = stack.pop()
+        lines[resc.RESC_NAME] = offset + resc_line(resc)
+        stack.extend((c, offset + '  ') for c in reversed(resc.children))
 
-    def resc_dicts(hier_list):
-        ret = {}
-        for h in hier_list:
-            ret.update(resc_dict(h))
+    return lines
 
-        return ret
 
-    def _run(args):
-        r, o, e = module.run_command(args)
+@traced
+def diff_hierarchies(module, from_forest, to_forest):
+    '''Returns the `diff` between from_forest and to_forest hierarchies
+    '''
+    before = hierarchy_lines(from_forest)
+    after = hierarchy_lines(to_forest)
 
-        if r != 0:
-            module.fail_json(
-                msg='iRODS cmd=\'%s\' failed with code=%s error=\'%s\'' %
-                (' '.join(args), r, e)
-            )
+    # resources are shown in wanted order, removed ones last
+    order = list(after)
+    order.extend(k for k in before if k not in after)
 
-        return o
+    return render_diff(module, before, after, order)
 
-    # build dicts with all resources for each side
-    all_from = resc_dicts(from_list)
-    all_to = resc_dicts(to_list)
 
-    # build sets of resc keys for each side
-    from_set = set(all_from.keys())
-    to_set = set(all_to.keys())
+def hierarchy_operations(from_forest, to_forest):
+    '''Returns the list of iadmin operations turning from_forest hierarchies
+    into to_forest hierarchies
+    '''
+    # index all resources of each side by key
+    all_from = {r.key(): r for r in from_forest.nodes()}
+    all_to = {r.key(): r for r in to_forest.nodes()}
 
     # lists of resources for each operation needed
-    rmresc = [all_from[k] for k in from_set - to_set]
-    mkresc = [all_to[k] for k in to_set - from_set]
+    rmresc = [r for k, r in all_from.items() if k not in all_to]
+    mkresc = [r for k, r in all_to.items() if k not in all_from]
     rmchild = []
     addchild = []
     modresc = []
 
-    for k in from_set & to_set:
-        f = all_from[k]
-        t = all_to[k]
+    for k, f in all_from.items():
+        t = all_to.get(k)
+        if t is None:
+            continue
 
-        if f['RESC_PARENT'] != t['RESC_PARENT']:
-            if f['RESC_PARENT'] is not None:
+        if f.RESC_PARENT != t.RESC_PARENT:
+            if f.RESC_PARENT is not None:
                 rmchild.append(f)
-            if t['RESC_PARENT'] is not None:
+            if t.RESC_PARENT is not None:
                 addchild.append(t)
 
         for field in _RESC_OPTIONAL_FIELDS:
-            if field in f and (field not in t or t[field] != f[field]):
-                modresc.append((t['RESC_NAME'], field, t[field]))
+            value = getattr(f, field)
+            if value is not None and getattr(t, field) != value:
+                modresc.append((t.RESC_NAME, field, getattr(t, field)))
 
-    iadmin = IrodsAdmin()
     operations = []
 
     # break parent-child relationships
     for child in rmchild:
-        op = ['rmchildfromresc', child['RESC_PARENT'], child['RESC_NAME']]
-        operations.append(iadmin(op))
+        op = ['rmchildfromresc', child.RESC_PARENT, child.RESC_NAME]
+        operations.append(op)
 
     # iadmin rmresc must be run on root resources
     for rm in rmresc:
-        if rm['RESC_PARENT'] is not None:
-            op = ['rmchildfromresc', rm['RESC_PARENT'], rm['RESC_NAME']]
-            operations.append(iadmin(op))
+        if rm.RESC_PARENT is not None:
+            op = ['rmchildfromresc', rm.RESC_PARENT, rm.RESC_NAME]
+            operations.append(op)
 
     # delete resources
     for rm in rmresc:
-        op = ['rmresc', rm['RESC_NAME']]
-        operations.append(iadmin(op))
+        op = ['rmresc', rm.RESC_NAME]
+        operations.append(op)
 
     # add resources
     for mk in mkresc:
         op = [
             'mkresc',
-            mk['RESC_NAME'],
-            mk['RESC_TYPE_NAME'],
+            mk.RESC_NAME,
+            mk.RESC_TYPE_NAME,
         ]
-        if 'RESC_LOC' in mk:
-            op.append(':'.join([mk['RESC_LOC'], mk['RESC_VAULT_PATH']]))
-        elif 'RESC_CONTEXT' in mk:
+        if mk.RESC_LOC is not None:
+            op.append(':'.join([mk.RESC_LOC, mk.RESC_VAULT_PATH or '']))
+        elif mk.RESC_CONTEXT is not None:
             op.append('""')
 
-        if 'RESC_CONTEXT' in mk:
-            op.append(mk['RESC_CONTEXT'])
+        if mk.RESC_CONTEXT is not None:
+            op.append(mk.RESC_CONTEXT)
 
-        operations.append(iadmin(op))
+        operations.append(op)
 
         # set configured fields for new resource
         for attr in ['RESC_STATUS', 'RESC_COMMENT', 'RESC_INFO']:
-            if attr not in mk:
+            if getattr(mk, attr) is None:
                 continue
 
             op = [
                 'modresc',
-                mk['RESC_NAME'],
+                mk.RESC_NAME,
                 _MODRESC_ATTR_NAME[attr],
-                mk[attr]
+                getattr(mk, attr)
             ]
 
-            operations.append(iadmin(op))
+            operations.append(op)
 
     # add parent-child relationship to new resources
     for mk in mkresc:
-        if mk['RESC_PARENT'] is not None:
-            op = ['addchildtoresc', mk['RESC_PARENT'], mk['RESC_NAME']]
+        if mk.RESC_PARENT is not None:
+            op = ['addchildtoresc', mk.RESC_PARENT, mk.RESC_NAME]
 
-            operations.append(iadmin(op))
+            operations.append(op)
 
     # add parent-child relationship to old resources
     for child in addchild:
         # TODO: implement context for parent-child relationship
-        op = ['addchildtoresc', child['RESC_PARENT'], child['RESC_NAME']]
+        op = ['addchildtoresc', child.RESC_PARENT, child.RESC_NAME]
 
-        operations.append(iadmin(op))
+        operations.append(op)
 
     # modify resources
     for name, attr, value in modresc:
@@ -534,13 +1622,34 @@ def compare_hierarchies(module, from_list, to_list):
             value = ' '
         op = ['modresc', name, attr, value]
 
-        operations.append(iadmin(op))
+        operations.append(op)
 
-    # run operations
-    for op in operations:
-        _run(op)
+    return operations
+
+
+@traced
+def compare_hierarchies(module, from_forest, to_forest, concurrency=1):
+    operations = hierarchy_operations(from_forest, to_forest)
+
+    iadmin = IrodsAdmin()
+
+    # run waves of independent operations in a single iadmin session, each
+    # wave only if the previous ones succeeded, or over parallel sessions
+    waves = operation_waves(operations)
+
+    if concurrency > 1:
+        run_iadmin_waves(module, waves, concurrency)
+    else:
+        session = IrodsAdminSession(module)
+
+        for wave in waves:
+            for op in wave:
+                session.add(op)
+            session.barrier()
 
-    return [' '.join(op) for op in operations]
+        session.run()
+
+    return [' '.join(iadmin(op)) for op in operations]
 
 
 def irods_env(host, port, zone):
@@ -560,8 +1669,184 @@ def irods_env(host, port, zone):
 
 CAT_INVALID_AUTHENTICATION = 7
 
+# errors telling that the client could not authenticate
+_AUTH_ERRORS = (
+    'CAT_INVALID_AUTHENTICATION',
+    'CAT_INVALID_USER',
+    'CAT_PASSWORD_EXPIRED',
+    'PAM_AUTH_PASSWORD_FAILED',
+)
+
+# smallest query needing an authenticated connection, allowed to any user
+_AUTH_CHECK_QUERY = "select ZONE_NAME where ZONE_TYPE = 'local'"
+
+
+def _native_auth_enabled(module):
+    '''Tells whether passwords are checked with python-irodsclient, as
+    selected by the `auth_backend` option
+    '''
+    backend = module.params.get('auth_backend') or 'icommands'
+
+    if backend == 'native' and not HAS_IRODSCLIENT:
+        module.fail_json(
+            msg='python-irodsclient is required for auth_backend=native'
+        )
+
+    return backend != 'icommands' and HAS_IRODSCLIENT
+
+
+def _native_auth_kwargs(host, port, zone, scheme):
+    '''Returns iRODSSession connection arguments, with defaults from the
+    iRODS environment file, None if the server is unknown
+    '''
+    try:
+        with open(irods_environment_file()) as f:
+            env = json.load(f)
+    except (OSError, IOError, ValueError):
+        env = {}
+
+    host = host or env.get('irods_host')
+    zone = zone or env.get('irods_zone_name')
+    if not host or not zone:
+        return None
+
+    kwargs = dict(
+        host=host,
+        port=int(port or env.get('irods_port') or 1247),
+        zone=zone,
+    )
+
+    if scheme != 'native':
+        kwargs['authentication_scheme'] = scheme
+
+    # PAM passwords only go through SSL connections
+    if (scheme != 'native' or
+            env.get('irods_client_server_policy') == 'CS_NEG_REQUIRE'):
+        kwargs.update(
+            ssl_context=ssl.create_default_context(
+                purpose=ssl.Purpose.SERVER_AUTH,
+                cafile=env.get('irods_ssl_ca_certificate_file'),
+            ),
+            client_server_negotiation='request_server_negotiation',
+            client_server_policy='CS_NEG_REQUIRE',
+            encryption_algorithm=env.get('irods_encryption_algorithm',
+                                         'AES-256-CBC'),
+            encryption_key_size=env.get('irods_encryption_key_size', 32),
+            encryption_num_hash_rounds=env.get(
+                'irods_encryption_num_hash_rounds', 16),
+            encryption_salt_size=env.get('irods_encryption_salt_size', 8),
+        )
+
+    return kwargs
+
+
+def _auth_scheme(version, ssl):
+    '''Returns the python-irodsclient authentication scheme matching the
+    `irods_version` and `ssl` options, as used by irods_init_client()
+    '''
+    if version == '4.3' and ssl:
+        return 'pam_password'
+
+    return 'native'
+
+
+def native_authenticate(module, host, port, zone, user, password,
+                        scheme='native'):
+    '''Authenticates user in-process with python-irodsclient
+
+    Returns a (verdict, password) tuple, verdict being None when the server
+    cannot be reached this way, and password the one to store in an auth
+    file (the server generated one for PAM). With `auth_backend: native`,
+    fails the module instead of returning a None verdict.
+    '''
+    required = module.params.get('auth_backend') == 'native'
+
+    kwargs = _native_auth_kwargs(host, port, zone, scheme)
+    if kwargs is None:
+        if required:
+            module.fail_json(msg='native authentication needs the iRODS '
+                             'host and zone, from options or environment')
+        return None, None
+
+    rejected = tuple(
+        getattr(irods.exception, err) for err in _AUTH_ERRORS
+        if hasattr(irods.exception, err)
+    )
+
+    with trace_span('python-irodsclient', 'auth', user=user,
+                    scheme=scheme) as span:
+        try:
+            session = iRODSSession(user=user, password=password, **kwargs)
+        except Exception as e:
+            span['error'] = str(e)
+            if required:
+                module.fail_json(msg='native authentication failed: %s' % e)
+            return None, None
+
+        try:
+            # connecting authenticates
+            with session.pool.get_connection():
+                pass
+
+            stored = password
+            if scheme != 'native':
+                negotiated = getattr(session, 'pam_pw_negotiated', None)
+                if not negotiated:
+                    if required:
+                        module.fail_json(msg='python-irodsclient did not '
+                                         'return the PAM password')
+                    return None, None
+                stored = negotiated[0]
+
+            span['verdict'] = True
+            return True, stored
+        except rejected:
+            span['verdict'] = False
+            return False, None
+        except Exception as e:
+            span['error'] = str(e)
+            if required:
+                module.fail_json(msg='native authentication failed: %s' % e)
+            return None, None
+        finally:
+            session.cleanup()
+
+
+def auth_cache(module):
+    '''Returns the on-host cache of auth file verdicts, None if disabled
+    '''
+    ttl = module.params.get('auth_cache_ttl') or 0
+    path = module.params.get('auth_cache_dir')
+    if ttl <= 0 or not path:
+        return None
+
+    return CatalogCache(os.path.expanduser(path), ttl, 'auth')
+
+
+def auth_file_key(auth_file, *identity):
+    '''Returns a cache key identifying the auth file state (mtime, size and
+    content hash) and the given identity, None if the file cannot be read
+    '''
+    try:
+        st = os.stat(auth_file)
+        with open(auth_file, 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+    except (OSError, IOError):
+        return None
+
+    return json.dumps(
+        [os.path.abspath(auth_file), st.st_mtime, st.st_size, digest] +
+        [str(i) for i in identity]
+    )
+
 
 def irods_check_client(module, host, port, zone, user, auth_file):
+    '''Tells whether auth_file authenticates user
+
+    Authenticates in-process with the stored password, or runs a one-row
+    iquest query, unless a valid verdict for the same auth file state is
+    found in the auth_cache() of the module.
+    '''
     env = dict(
         IRODS_USER_NAME=user,
         IRODS_AUTHENTICATION_FILE=auth_file,
@@ -570,22 +1855,94 @@ def irods_check_client(module, host, port, zone, user, auth_file):
     if not os.path.isfile(auth_file):
         return False
 
+    cache = auth_cache(module)
+    key = None
+    if cache is not None:
+        key = auth_file_key(auth_file, user, host, port, zone)
+
+        with trace_span('auth_cache', hit=False) as span:
+            if key is not None and cache.get(key):
+                span['hit'] = True
+                return True
+
+    verdict = None
+    if _native_auth_enabled(module):
+        try:
+            with open(auth_file) as f:
+                password = password_obfuscation.decode(f.read().strip())
+        except (OSError, IOError, ValueError):
+            password = None
+
+        if password is not None:
+            verdict, stored = native_authenticate(module, host, port, zone,
+                                                  user, password)
+
+    if verdict is not None:
+        if verdict and key is not None:
+            cache.put(key, True)
+
+        return verdict
+
     env.update(irods_env(host, port, zone))
 
-    ils = IrodsLs()
+    iquest = IrodsQuest()
 
-    r, o, e = module.run_command(ils(['/']), environ_update=env)
+    r, o, e = module.run_command(iquest(['--no-page', '%s', _AUTH_CHECK_QUERY]),
+                                 environ_update=env)
 
-    if r == CAT_INVALID_AUTHENTICATION:
+    if r == CAT_INVALID_AUTHENTICATION or any(
+            err in o + e for err in _AUTH_ERRORS):
         return False
 
     if r != 0:
-        module.fail_json(msg='ils failed with code=%s error=\'%s\'' % (r, e))
+        module.fail_json(msg='iquest failed with code=%s error=\'%s\'' % (r, e))
+
+    if key is not None:
+        cache.put(key, True)
 
     return True
 
 
+def native_init_client(module, host, port, zone, user, password, auth_file,
+                       version='4.2', ssl=True):
+    '''Authenticates in-process and writes the scrambled password to
+    auth_file, without running iinit
+
+    Returns the authentication verdict, None if it could not be obtained
+    this way.
+    '''
+    verdict, stored = native_authenticate(module, host, port, zone, user,
+                                          password, _auth_scheme(version, ssl))
+
+    if verdict:
+        try:
+            fd = os.open(auth_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC,
+                         0o600)
+            with os.fdopen(fd, 'w') as f:
+                f.write(password_obfuscation.encode(stored) + '\n')
+        except (OSError, IOError) as e:
+            module.fail_json(msg='cannot write %s: %s' % (auth_file, e))
+
+    return verdict
+
+
 def irods_init_client(module, host, port, zone, user, password, auth_file, version='4.2', ssl=True):
+    if _native_auth_enabled(module):
+        verdict = native_init_client(module, host, port, zone, user, password,
+                                     auth_file, version, ssl)
+        if verdict is not None:
+            return verdict
+
+    return icommands_init_client(module, host, port, zone, user, password,
+                                 auth_file, version, ssl)
+
+
+def icommands_init_client(module, host, port, zone, user, password, auth_file, version='4.2', ssl=True):
+    '''Runs iinit to write the scrambled password to auth_file
+
+    run_command() sets environ_update in the process environment, so this
+    must not run concurrently with other commands.
+    '''
     env = dict(
         IRODS_USER_NAME=user,
         IRODS_AUTHENTICATION_FILE=auth_file,
@@ -613,52 +1970,378 @@ def irods_init_client(module, host, port, zone, user, password, auth_file, versi
     return True
 
 
-def check_irods_password(module, host, port, zone, user, password, version, ssl):
+def native_check_password(module, host, port, zone, user, password, version, ssl):
+    '''Verifies a password in-process, returns None if it could not be
+    verified this way
+
+    Needs no auth file nor command, so that it can run concurrently.
+    '''
+    if not _native_auth_enabled(module):
+        return None
+
+    verdict, stored = native_authenticate(module, host, port, zone, user,
+                                          password, _auth_scheme(version, ssl))
+
+    return verdict
+
+
+def icommands_check_password(module, host, port, zone, user, password, version, ssl):
+    '''Verifies a password with iinit and a temporary auth file, see
+    icommands_init_client()
+    '''
     fd, pwdfile = mkstemp()
     try:
         os.close(fd)
 
-        return irods_init_client(module, host, port, zone, user, password,
-                                 pwdfile, version, ssl)
+        return icommands_init_client(module, host, port, zone, user, password,
+                                     pwdfile, version, ssl)
 
     finally:
         os.unlink(pwdfile)
 
 
-def get_user_groups(module, zone=None, group=None):
-    iquest = IrodsQuest()
+def check_irods_password(module, host, port, zone, user, password, version, ssl):
+    verdict = native_check_password(module, host, port, zone, user, password,
+                                    version, ssl)
+    if verdict is not None:
+        return verdict
+
+    return icommands_check_password(module, host, port, zone, user, password,
+                                    version, ssl)
+
+
+# sorted runs merged at once by external_sort(), each one is an open file
+_SORT_MAX_RUNS = 64
+
+
+def _sorted_run(records, key):
+    '''Returns a temporary file of the records sorted by key, as JSON lines
+    '''
+    f = TemporaryFile(mode='w+')
+
+    for record in sorted(records, key=key):
+        f.write(json.dumps(record) + '\n')
+    f.seek(0)
+
+    return f
+
+
+def _read_run(f):
+    for line in f:
+        yield json.loads(line)
+
+
+def external_sort(records, key, batch_size):
+    '''Yields JSON serializable records sorted by key, holding at most
+    batch_size records in memory
+
+    Records are sorted by batches into temporary files, which are then
+    merged. Records of equal keys keep their input order.
+    '''
+    runs = []
+    batch = []
+
+    try:
+        for record in records:
+            batch.append(record)
+
+            if len(batch) < batch_size:
+                continue
+
+            runs.append(_sorted_run(batch, key))
+            batch = []
+
+            if len(runs) >= _SORT_MAX_RUNS:
+                merged = TemporaryFile(mode='w+')
+                for r in heapq.merge(*[_read_run(f) for f in runs], key=key):
+                    merged.write(json.dumps(r) + '\n')
+                merged.seek(0)
+
+                for f in runs:
+                    f.close()
+                runs = [merged]
+
+        if not runs:
+            for record in sorted(batch, key=key):
+                yield record
+            return
+
+        runs.append(_sorted_run(batch, key))
+        batch = []
+
+        for record in heapq.merge(*[_read_run(f) for f in runs], key=key):
+            yield record
+    finally:
+        for f in runs:
+            f.close()
+
+
+def iter_users(module):
+    '''Yields catalog users of the `zone` option (all zones if unset)
+    '''
+    return irods_quest(module).iter_select(
+        module, _USER_FIELDS, zone_where(module, 'USER_ZONE')
+    )
+
+
+def get_users(module, names=None):
+    '''Returns catalog users indexed by name, restricted to `names` if given
+    '''
+    if names is None:
+        rows = iter_users(module)
+    else:
+        rows = select_in(module, _USER_FIELDS, 'USER_NAME', names,
+                         zone_where(module, 'USER_ZONE'))
+
+    return {user['USER_NAME']: user for user in rows}
+
+
+def delete_user_cmd(user):
+    user_name = user['USER_NAME']
+    if user['USER_TYPE'] == 'rodsgroup':
+        return ['rmgroup', user_name]
+
+    if 'USER_ZONE' in user:
+        user_name += '#' + user['USER_ZONE']
+
+    return ['rmuser', user_name]
+
+
+def add_user_cmd(user):
+    user_name = user['USER_NAME']
+    if user['USER_TYPE'] == 'rodsgroup':
+        return ['mkgroup', user_name]
+
+    if 'USER_ZONE' in user:
+        user_name += '#' + user['USER_ZONE']
+
+    return ['mkuser', user_name , user['USER_TYPE']]
+
+
+def modify_user_cmd(user, attr, value):
+    return ['moduser', user, _MODUSER_ATTR_NAME[attr], value]
+
+
+class UserGroups:
+    '''Group memberships indexed both ways
 
-    fmt = ':'.join(['%s'] * len(_USER_GROUP_FIELDS))
+    `groups` maps group names to the set of their members and `users` maps
+    user names to the set of their groups. Indexing the object by a group
+    name returns the group members.
+    '''
 
-    cmd = 'select ' + ', '.join(_USER_GROUP_FIELDS)
+    def __init__(self):
+        self.groups = {}
+        self.users = {}
+        self.memberships = 0
 
-    where_clauses = []
+    def add(self, user, group):
+        members = self.groups.setdefault(group, set())
+
+        if user == group or user in members:
+            # irods user/group are quite the same
+            return
+
+        members.add(user)
+        self.users.setdefault(user, set()).add(group)
+        self.memberships += 1
+
+    def members(self, group):
+        return self.groups.get(group, set())
+
+    def groups_of(self, user):
+        return self.users.get(user, set())
+
+    def is_member(self, user, group):
+        return user in self.groups.get(group, ())
+
+    def __getitem__(self, group):
+        return self.groups[group]
+
+    def __contains__(self, group):
+        return group in self.groups
+
+    def __iter__(self):
+        return iter(self.groups)
+
+    def __len__(self):
+        return len(self.groups)
+
+    def counts(self):
+        return dict(
+            groups=len(self.groups),
+            users=len(self.users),
+            memberships=self.memberships,
+        )
+
+    def to_dict(self):
+        '''Returns the index as JSON serializable dicts of sorted lists
+        '''
+        return dict(
+            groups={g: sorted(m) for g, m in self.groups.items()},
+            users={u: sorted(g) for u, g in self.users.items()},
+            counts=self.counts(),
+        )
+
+    @staticmethod
+    def is_index(data):
+        '''Tells whether data is a to_dict() result rather than a dict of
+        member lists by group name, where `groups`, `users` or `counts`
+        may be group names
+        '''
+        return (
+            isinstance(data.get('groups'), dict)
+            and isinstance(data.get('users'), dict)
+            and isinstance(data.get('counts'), dict)
+        )
+
+    @classmethod
+    def from_dict(cls, data):
+        '''Builds the index of a to_dict() result, or of a dict of member
+        lists by group name
+        '''
+        if cls.is_index(data):
+            data = data['groups']
+
+        index = cls()
+        for g, members in data.items():
+            index.groups.setdefault(g, set())
+
+            for u in members or ():
+                index.add(u, g)
+
+        return index
+
+
+def get_user_groups(module, zone=None, group=None):
+    '''Returns the UserGroups index of catalog group memberships
+    '''
+    where = []
 
     if zone is not None:
-        where_clauses.append('USER_ZONE = \'{}\''.format(zone))
+        where.append(('USER_ZONE', '=', zone))
 
     if group is not None:
-        where_clauses.append('USER_GROUP_NAME = \'{}\''.format(group))
+        where.append(('USER_GROUP_NAME', '=', group))
 
-    if where_clauses:
-        cmd += ' where ' + ' and '.join(where_clauses)
+    rows = irods_quest(module).iter_select(module, _USER_GROUP_FIELDS, where)
 
-    r, o, e = module.run_command(iquest(['--no-page', fmt, cmd]))
+    index = UserGroups()
+    for row in rows:
+        index.add(row['USER_NAME'], row['USER_GROUP_NAME'])
 
-    if r != 0:
-        module.fail_json(
-            msg='iquest cmd=\'%s\' failed with code=%s error=\'%s\'' %
-            (cmd, r, e)
-        )
+    return index
 
-    ret = {}
-    for l in o.strip().split('\n'):
-        u, g = l.split(':', 1)
 
-        if g not in ret:
-            ret[g] = []
+def get_group_members(module, zone):
+    '''Returns the UserGroups index of the memberships of users of all
+    zones, users of other zones than `zone` being named user#zone
+    '''
+    rows = irods_quest(module).iter_select(module, _GROUP_MEMBER_FIELDS)
 
-        if g != u: # irods user/group are quite the same
-            ret[g].append(u)
+    index = UserGroups()
+    for row in rows:
+        name = row['USER_NAME']
+        if row['USER_ZONE'] != zone:
+            name += '#' + row['USER_ZONE']
+
+        index.add(name, row['USER_GROUP_NAME'])
+
+    return index
+
+
+def local_zone(module):
+    '''Returns the name of the local zone (there must be only one)
+    '''
+    return get_zones(module, ZONE_TYPE='local')[0]['ZONE_NAME']
+
+
+# catalog tables that can be loaded by name with load_catalog_snapshot()
+CATALOG_TABLES = dict(
+    local_zone=local_zone,
+    rescs=rescs_id_name,
+    resc_trees=resc_trees,
+    user_groups=lambda module: get_user_groups(module, module.params['zone']),
+)
+
+
+class CatalogLoadError(Exception):
+    pass
+
+
+class _WorkerModule:
+    '''Module proxy for worker threads, turning fail_json into a
+    CatalogLoadError so that only the main thread reports failures
+    '''
+
+    def __init__(self, module):
+        self._module = module
+
+    def __getattr__(self, name):
+        return getattr(self._module, name)
+
+    def fail_json(self, **kwargs):
+        raise CatalogLoadError(kwargs)
+
+
+def map_concurrently(module, func, items, concurrency=1):
+    '''Returns the list of func(module, item) results for all items, run on
+    a pool of `concurrency` threads
+
+    func is given a module proxy whose fail_json stops pending calls, the
+    module then fails from the main thread.
+    '''
+    worker = _WorkerModule(module)
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        futures = [pool.submit(func, worker, item) for item in items]
+
+        try:
+            return [f.result() for f in futures]
+        except CatalogLoadError as e:
+            for f in futures:
+                f.cancel()
+            error = e.args[0]
+
+    module.fail_json(**error)
+
+
+class CatalogSnapshot:
+    '''Catalog tables loaded by load_catalog_snapshot(), one attribute per
+    table
+    '''
+
+    def __init__(self, **tables):
+        self.__dict__.update(tables)
+
+
+def load_catalog_snapshot(module, tables=(), **loaders):
+    '''Loads catalog tables concurrently, one thread per table
+
+    `tables` are names of CATALOG_TABLES, `loaders` are additional tables
+    given as functions of the module. Returns a CatalogSnapshot.
+    '''
+    loaders = dict(loaders)
+    for name in tables:
+        loaders[name] = CATALOG_TABLES[name]
+
+    if not loaders:
+        return CatalogSnapshot()
+
+    worker = _WorkerModule(module)
+
+    with ThreadPoolExecutor(max_workers=len(loaders)) as pool:
+        futures = {
+            name: pool.submit(loader, worker)
+            for name, loader in loaders.items()
+        }
+
+        tables = {}
+        for name, f in futures.items():
+            try:
+                tables[name] = f.result()
+            except CatalogLoadError as e:
+                module.fail_json(**e.args[0])
+
+    return CatalogSnapshot(**tables)
 
-    return ret
@@ -9,6 +9,10 @@ short_description: sets iRODS password file for a user
 
 description:
   - "Configures icommands password for a user by running iinit."
+  - "The existing password file is checked with a single one-row query.
+     With `auth_cache_ttl`, successful checks are remembered on the host
+     for the same password file content, so that the server is only
+     contacted again once the file changed or the verdict expired."
   - "Has to be used with `become` and `become_user` to the UNIX user's icommands
      are to be configured."
 
@@ -37,6 +41,22 @@ options:
       - "iRODS password"
     required: true
     type: str
+  auth_cache_ttl:
+    description:
+      - "Lifetime in seconds of cached password file checks. `0` disables
+         the cache."
+    required: false
+    type: int
+    default: 0
+  auth_cache_dir:
+    description: directory where password file checks are cached
+    required: false
+    type: path
+    default: ~/.cache/mcia_irods/auth
+
+extends_documentation_fragment:
+  - mcia.irods.common.auth
+  - mcia.irods.common.trace
 
 author:
     - "Pierre Gay (@pigay)"
@@ -60,6 +80,9 @@ from ansible.module_utils.basic import AnsibleModule
 from ansible_collections.mcia.irods.plugins.module_utils.irods_utils import (
     irods_init_client,
     irods_check_client,
+    instrument_module,
+    irods_auth_argument_spec,
+    irods_trace_argument_spec,
 )
 
 
@@ -73,12 +96,21 @@ def main():
         password_file=dict(type='str', no_log=False),
         ssl=dict(type='bool', default=True),
         irods_version=dict(type='str', default='4.2'),
+        auth_cache_ttl=dict(type='int', default=0, required=False),
+        auth_cache_dir=dict(
+            type='path',
+            default='~/.cache/mcia_irods/auth',
+            required=False,
+        ),
     )
+    module_args.update(irods_auth_argument_spec())
+    module_args.update(irods_trace_argument_spec())
 
     module = AnsibleModule(
         argument_spec=module_args,
         supports_check_mode=True
     )
+    instrument_module(module)
 
     result = dict(
         changed=False,
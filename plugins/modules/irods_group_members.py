@@ -0,0 +1,188 @@
+#! /usr/bin/python
+
+
+DOCUMENTATION = r'''
+---
+module: irods_group_members
+
+short_description: configure iRODS group members
+
+description:
+  - "Configures the members of iRODS groups. The membership of all groups is
+     read with a single catalog query, and only the missing or extra members
+     are added or removed, in a single iadmin session."
+  - "To use this module, `become_user` must be set to a unix user configured to
+     have access to a rodsadmin iRODS user."
+
+options:
+  zone:
+    description: name of iRODS zone
+    required: false
+    type: str
+    default: <local zone>
+  groups:
+    description:
+      - "dictionary of member user names per group name, users of other
+         zones than `zone` being named `user#zone`"
+    required: true
+    type: dict(list[str])
+  mode:
+    description:
+      - "`exclusive` makes group members exactly the listed users, removing
+         the others. `append` only adds the listed users to the groups."
+    required: false
+    type: str
+    choices: [exclusive, append]
+    default: exclusive
+
+extends_documentation_fragment:
+  - mcia.irods.common
+  - mcia.irods.common.trace
+  - mcia.irods.common.diff
+
+author:
+  - "Pierre Gay (@pigay)"
+'''
+
+EXAMPLES = r'''
+- name: set members of demoGroup
+  mcia.irods.irods_group_members:
+    groups:
+      demoGroup:
+        - demoUser1
+        - demoUser2
+
+- name: add demoUser3 to demoGroup, keeping other members
+  mcia.irods.irods_group_members:
+    groups:
+      demoGroup:
+        - demoUser3
+    mode: append
+'''
+
+from ansible.module_utils.basic import AnsibleModule
+
+from ansible_collections.mcia.irods.plugins.module_utils.irods_utils import (
+    IrodsAdminSession,
+    irods_common_argument_spec,
+    irods_diff_argument_spec,
+    get_group_members,
+    load_catalog_snapshot,
+    local_zone,
+    render_diff,
+    instrument_module,
+)
+
+
+def members_to_lines(groups):
+    return {
+        g: g + ': ' + ','.join(sorted(members))
+        for g, members in groups.items()
+    }
+
+
+def member_name(user, zone):
+    '''Returns the catalog member name of user, without `zone` suffix for
+    users of zone
+    '''
+    name, sep, user_zone = user.partition('#')
+
+    if not sep or user_zone == zone:
+        return name
+
+    return user
+
+
+def member_operations(got, wanted):
+    '''Returns the iadmin commands turning got group members into wanted
+    group members
+    '''
+    operations = []
+
+    for g in sorted(wanted):
+        for u in sorted(got[g] - wanted[g]):
+            operations.append(['rfg', g, u])
+
+        for u in sorted(wanted[g] - got[g]):
+            operations.append(['atg', g, u])
+
+    return operations
+
+
+def main():
+    module_args = dict(
+        zone=dict(type='str', required=False),
+        groups=dict(type='dict', required=True),
+        mode=dict(
+            type='str',
+            default='exclusive',
+            required=False,
+            choices=['exclusive', 'append'],
+        ),
+    )
+    module_args.update(irods_common_argument_spec())
+    module_args.update(irods_diff_argument_spec())
+
+    module = AnsibleModule(
+        argument_spec=module_args,
+        supports_check_mode=True
+    )
+    instrument_module(module)
+
+    result = dict(
+        changed=False,
+        operations=[],
+    )
+
+    # we need a zone to ensure we get unique groups
+    if module.params['zone'] is None:
+        # default to local zone (must be only one)
+        module.params['zone'] = local_zone(module)
+
+    # members of all zones, so that remote members are seen
+    user_groups = load_catalog_snapshot(
+        module,
+        user_groups=lambda m: get_group_members(m, m.params['zone']),
+    ).user_groups
+
+    missing = sorted(g for g in module.params['groups'] if g not in user_groups)
+    if missing:
+        module.fail_json(msg='unknown groups: %s' % ', '.join(missing))
+
+    got = {}
+    wanted = {}
+
+    for g, members in module.params['groups'].items():
+        got[g] = set(user_groups.members(g))
+        wanted[g] = set(
+            member_name(u, module.params['zone']) for u in members or []
+        )
+
+        if module.params['mode'] == 'append':
+            wanted[g] |= got[g]
+
+    if got != wanted:
+        result['changed'] = True
+
+    if module._diff:
+        result['diff'] = render_diff(
+            module, members_to_lines(got), members_to_lines(wanted)
+        )
+
+    if module.check_mode or not result['changed']:
+        module.exit_json(**result)
+
+    # apply the whole delta in a single iadmin session
+    session = IrodsAdminSession(module)
+
+    for cmd in member_operations(got, wanted):
+        session.add(cmd)
+        result['operations'].append(' '.join(['iadmin'] + cmd))
+
+    session.run()
+
+    module.exit_json(**result)
+
+
+if __name__ == '__main__':
+    main()
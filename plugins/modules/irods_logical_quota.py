@@ -2,7 +2,6 @@
 
 #TODO
 # - check if rule engine instance is configured on server_config.json
-# - do not check the presence of "asq" at each loop (maybe use facts) to improve performance
 
 
 DOCUMENTATION = r'''
@@ -21,17 +20,33 @@ description:
      logical_quotas_start_monitoring_collection
      logical_quotas_get_collection_status
      logical_quotas_set_maximum_size_in_bytes
-     logical_quotas_set_maximum_number_of_data_objects"
-
-  - "features not implemented :
+     logical_quotas_set_maximum_number_of_data_objects
      logical_quotas_count_total_number_of_data_objects
      logical_quotas_count_total_size_in_bytes
-     logical_quotas_recalculate_totals
+     logical_quotas_recalculate_totals"
+
+  - "features not implemented :
      logical_quotas_stop_monitoring_collection
      logical_quotas_unset_maximum_number_of_data_objects
      logical_quotas_unset_maximum_size_in_bytes
      logical_quotas_unset_total_number_of_data_objects
      logical_quotas_unset_total_size_in_bytes"
+  - "Monitoring is only started on collections without logical quotas
+     totals yet, since starting it recounts the whole collection tree."
+  - "With the `collections` option, many collections are handled in one
+     run: their existence and their current quota are read with one
+     catalog query each, and only the changed limits are set, through
+     batched native rule language calls."
+  - "Recalculations (`recalculate` option) can run for hours on big
+     collections, up to `concurrency` collections at a time. The module
+     returns when they are over, run it with `async` and `poll: 0` to run
+     them in the background. The progress of each collection is kept in a
+     job status file on the managed host, polled by running the module
+     with the `job_id` option, much like the `async_status` module, and
+     removed with `cleanup`."
+  - "The `report` option reports the logical quotas of all the collections
+     of the zone, or those under `prefix`, from a single catalog query on
+     their AVUs, instead of one status rule call per collection."
 
 
 requirements:
@@ -41,10 +56,31 @@ requirements:
 
 options:
   collection:
-    description: absolute path to collection
-    required: true
+    description:
+      - "absolute path to collection, one of `collection`, `collections`
+         and `job_id` is required unless `report` is true"
+      - "excludes `job_id`, unless `recalculate` is set"
+    required: false
     type: str
     default: <none>
+  collections:
+    description: list of collections with their limits, instead of `collection`
+    required: false
+    type: list
+    elements: dict
+    suboptions:
+      collection:
+        description: absolute path to collection
+        required: true
+        type: str
+      files_limit:
+        description: maximum number of data objects (integer passed as string)
+        required: false
+        type: str
+      bytes_limit:
+        description: maximum size in bytes (integer passed as string)
+        required: false
+        type: str
   files_limit:
     description: quota set the maximum number of data objects (integer passed as string)
     required: false
@@ -60,6 +96,61 @@ options:
     required: false
     type: bol
     default: false
+  recalculate:
+    description:
+      - "Runs a job recalculating the totals of the collections
+         (`totals`), or only their number of data objects or their size.
+         Limits are not configured when set."
+    required: false
+    type: str
+    choices: [totals, number_of_data_objects, size_in_bytes]
+  concurrency:
+    description: number of collections recalculated at a time by a job
+    required: false
+    type: int
+    default: 4
+  job_id:
+    description:
+      - "id of a recalculation job to report the status of, or with
+         `recalculate`, the id given to the new job, a random one
+         otherwise"
+    required: false
+    type: str
+  cleanup:
+    description:
+      - "removes the status file of the finished job `job_id`, like
+         `async_status` with `mode: cleanup`"
+    required: false
+    type: bool
+    default: false
+  jobs_dir:
+    description: directory of the job status files on the managed host
+    required: false
+    type: path
+    default: ~/.cache/mcia_irods/jobs
+  report:
+    description:
+      - "report the logical quotas of all collections, excludes
+         `collection`, `collections` and `job_id`"
+    required: false
+    type: bool
+    default: false
+  prefix:
+    description: only report the collections under this path
+    required: false
+    type: str
+  sort:
+    description:
+      - "order of reported collections, `utilisation` lists the most used
+         first"
+    required: false
+    type: str
+    choices: [utilisation, collection]
+    default: utilisation
+
+extends_documentation_fragment:
+  - mcia.irods.common
+  - mcia.irods.common.trace
 
 author:
   - "Antoine Migeon"
@@ -90,6 +181,46 @@ EXAMPLES = r'''
     - { collection: "/myzone/home/a_collection"}
     - { collection: "/myzone/home/other_collection"}
 
+- name: Set quotas of all project collections at once
+  mcia.irods.irods_logical_quota:
+    collections:
+      - collection: "/myzone/home/a_collection"
+        files_limit: "99"
+      - collection: "/myzone/home/other_collection"
+        files_limit: "10"
+        bytes_limit: "1073741824"
+
+- name: Recalculate totals of all project collections in the background
+  mcia.irods.irods_logical_quota:
+    collections: "{{ projects }}"
+    recalculate: totals
+    concurrency: 8
+    job_id: projects-totals
+  async: 43200
+  poll: 0
+
+- name: Wait for the recalculation, reporting each collection progress
+  mcia.irods.irods_logical_quota:
+    job_id: projects-totals
+  register: job
+  until: job.finished
+  retries: 720
+  delay: 60
+
+- name: Remove the recalculation status file
+  mcia.irods.irods_logical_quota:
+    job_id: projects-totals
+    cleanup: true
+
+- name: Report the ten most used project collections
+  mcia.irods.irods_logical_quota:
+    report: true
+    prefix: "/myzone/projects"
+  register: quota_report
+
+- debug:
+    msg: "{{ quota_report.report[:10] }}"
+
 '''
 
 RETURN = r'''
@@ -119,18 +250,74 @@ files_limit:
     type: str
     returned: always
     sample: {"files_limit": "10123200"}
+monitoring:
+    description:
+      - "`started` when monitoring of the collection was started by this run,
+         `monitored` when it was already monitored"
+    type: str
+    returned: always
+    sample: {"monitoring": "monitored"}
+collections:
+    description:
+      - "status of each collection of the `collections` option, with the
+         same keys as above and whether its limits changed"
+    type: list
+    elements: dict
+    returned: with collections
+job_id:
+    description: id of the recalculation job
+    type: str
+    returned: with recalculate or job_id
+    sample: "projects-totals"
+finished:
+    description: whether all collections of the job were recalculated
+    type: bool
+    returned: with recalculate or job_id
+results_file:
+    description: path of the job status file on the managed host
+    type: str
+    returned: with recalculate or job_id
+job:
+    description:
+      - "job status: its `operation`, `pid`, `started` and `ended` epoch
+         times, and the `status` (`pending`, `running`, `ok` or `failed`)
+         and `msg` of each of its `collections`"
+    type: dict
+    returned: with recalculate or job_id
+report:
+    description:
+      - "logical quotas of each collection, with the same keys as above and
+         the `bytes_utilisation` and `files_utilisation` percentages of the
+         limits, and their maximum as `utilisation` (null without limit)"
+    type: list
+    elements: dict
+    returned: with report
 '''
 
 from ansible.module_utils.basic import AnsibleModule
 
 from ansible_collections.mcia.irods.plugins.module_utils.irods_utils import (
-    IrodsQuest,
     IrodsLs,
     IrodsRule,
-    IrodsAdmin
+    IrodsAdmin,
+    instrument_module,
+    catalog_cache,
+    invalidate_catalog_cache,
+    irods_common_argument_spec,
+    irods_quest,
+    load_catalog_snapshot,
+    map_concurrently,
+    run_process,
+    select_in,
 )
 
+import errno
 import json
+import os
+import threading
+import time
+import uuid
+from tempfile import mkstemp
 
 _QUOTA_FIELDS = {
     'bytes_limit' : 'irods::logical_quotas::maximum_size_in_bytes',
@@ -139,48 +326,101 @@ _QUOTA_FIELDS = {
     'total_files' : 'irods::logical_quotas::total_number_of_data_objects',
 }
 
+_LOGICAL_QUOTAS_INSTANCE = 'irods_rule_engine_plugin-logical_quotas-instance'
+
+_RULE_LANGUAGE_INSTANCE = 'irods_rule_engine_plugin-irods_rule_language-instance'
+
+# rule setting each limit
+_LIMIT_OPERATIONS = {
+    'bytes_limit': 'logical_quotas_set_maximum_size_in_bytes',
+    'files_limit': 'logical_quotas_set_maximum_number_of_data_objects',
+}
+
+_QUOTA_AVU_FIELDS = ['COLL_NAME', 'META_COLL_ATTR_NAME', 'META_COLL_ATTR_VALUE']
+
+_QUOTA_AVU_WHERE = ('META_COLL_ATTR_NAME', 'like', 'irods::logical_quotas::%')
+
+# irule rule text is limited to META_STR_LEN (2700) characters
+_RULE_MAX_LEN = 2500
+
+# rule of each recalculation
+_RECALCULATE_OPERATIONS = {
+    'totals': 'logical_quotas_recalculate_totals',
+    'number_of_data_objects': 'logical_quotas_count_total_number_of_data_objects',
+    'size_in_bytes': 'logical_quotas_count_total_size_in_bytes',
+}
+
+# SQL of the specific queries used by the logical quotas plugin, by alias,
 # required to enable logical quota monitoring
-def add_specific_query_logical_quotas(module):
+_SPECIFIC_QUERIES = {
+    "logical_quotas_count_data_objects_recursive" : "select count(distinct data_id) from R_DATA_MAIN d inner join R_COLL_MAIN c on d.coll_id = c.coll_id where coll_name like ?",
+    "logical_quotas_sum_data_object_sizes_recursive" : "select sum(t.data_size) from (select data_id, data_size from R_DATA_MAIN d inner join R_COLL_MAIN c on d.coll_id = c.coll_id where coll_name like ? and data_is_dirty in (\'1\', \'4\') group by data_id, data_size) as t"
+}
+
+_SPECIFIC_QUERIES_CACHE_KEY = 'iadmin lsq ' + ' '.join(sorted(_SPECIFIC_QUERIES))
+
 
+def registered_specific_queries(module):
+    '''Returns the aliases of _SPECIFIC_QUERIES registered in the catalog,
+    listed with a single iadmin lsq
+    '''
     iadmin = IrodsAdmin()
-    iquest = IrodsQuest()
 
-    specific_queries = {
-            "logical_quotas_count_data_objects_recursive" : "select count(distinct data_id) from R_DATA_MAIN d inner join R_COLL_MAIN c on d.coll_id = c.coll_id where coll_name like ?",
-            "logical_quotas_sum_data_object_sizes_recursive" : "select sum(t.data_size) from (select data_id, data_size from R_DATA_MAIN d inner join R_COLL_MAIN c on d.coll_id = c.coll_id where coll_name like ? and data_is_dirty in (\'1\', \'4\') group by data_id, data_size) as t"
-    }
+    cmd = ['lsq']
+    r, o, e = module.run_command(iadmin(cmd))
 
-    for specific_query in specific_queries:
+    if r != 0:
+        module.fail_json(
+            msg='iadmin cmd=\'%s\' failed with code=%s error=\'%s\'' %
+            (cmd, r, e)
+        )
+
+    # lsq prints the SQL and the alias of each query on their own lines
+    lines = set(l.strip() for l in o.splitlines())
+
+    return set(alias for alias in _SPECIFIC_QUERIES if alias in lines)
+
+
+def add_specific_query_logical_quotas(module):
+    '''Registers the specific queries of the logical quotas plugin
+
+    Registration is remembered in the catalog cache, see
+    remember_specific_queries().
+    '''
+    cache = catalog_cache(module)
+    if cache is not None and cache.get(_SPECIFIC_QUERIES_CACHE_KEY):
+        return
+
+    iadmin = IrodsAdmin()
+
+    registered = registered_specific_queries(module)
 
-        # check if queries are already configured
-        cmd = ['--no-page', '--sql', 'lsl', specific_queries[specific_query] ]
-        r, o, e = module.run_command(iquest(cmd))
+    for alias in sorted(set(_SPECIFIC_QUERIES) - registered):
+        # add query: iadmin asq 'SQL query' [Alias]
+        cmd = ['asq', _SPECIFIC_QUERIES[alias], alias]
+        r, o, e = module.run_command(iadmin(cmd))
 
-        # iquest returns rc=1 for CAT_NO_ROWS_FOUND in non-interactive mode (no TTY).
-        # The message may appear in stdout or stderr depending on the iRODS version.
-        if r != 0 and 'CAT_NO_ROWS_FOUND' not in o and 'CAT_NO_ROWS_FOUND' not in e:
+        if r != 0 and 'CATALOG_ALREADY_HAS_ITEM_BY_THAT_NAME' not in e and 'CAT_INVALID_ARGUMENT' not in e:
             module.fail_json(
-                msg='iquest cmd=\'%s\' failed with code=%s error=\'%s\'' %
+                msg='iadmin cmd=\'%s\' failed with code=%s error=\'%s\'' %
                 (cmd, r, e)
             )
 
-        if 'CAT_NO_ROWS_FOUND' in o or 'CAT_NO_ROWS_FOUND' in e:
-            # add query if necessary: iadmin asq 'SQL query' [Alias]
-            cmd = ['asq', specific_queries[specific_query], specific_query]
-            r, o, e = module.run_command(iadmin(cmd))
 
-            if r != 0 and 'CATALOG_ALREADY_HAS_ITEM_BY_THAT_NAME' not in e and 'CAT_INVALID_ARGUMENT' not in e:
-                module.fail_json(
-                    msg='iadmin cmd=\'%s\' failed with code=%s error=\'%s\'' %
-                    (cmd, r, e)
-                )
+def remember_specific_queries(module):
+    '''Caches the registration of the specific queries, has to be called
+    after the catalog writes of the run since they drop the cache
+    '''
+    cache = catalog_cache(module)
+    if cache is not None:
+        cache.put(_SPECIFIC_QUERIES_CACHE_KEY, True)
 
 
 def invoke_rule(module, rule):
 
     irule = IrodsRule()
 
-    cmd = ['-r', 'irods_rule_engine_plugin-logical_quotas-instance', json.dumps(rule), 'null', 'ruleExecOut']
+    cmd = ['-r', _LOGICAL_QUOTAS_INSTANCE, json.dumps(rule), 'null', 'ruleExecOut']
     r, o, e = module.run_command(irule(cmd))
 
     if r != 0:
@@ -196,19 +436,515 @@ def invoke_rule(module, rule):
     return o
 
 
+def _rule_string(value):
+    '''Returns a rule language string literal of value, `*var` and `$var`
+    are expanded in strings unless escaped
+    '''
+    for c in '\\"*$':
+        value = value.replace(c, '\\' + c)
+
+    return '"%s"' % value
+
+
+def rule_call(operation, *args):
+    '''Returns a native rule language call of a logical quotas operation
+    '''
+    return '%s(%s)' % (operation, ', '.join([_rule_string(a) for a in args]))
+
+
+def invoke_rule_calls(module, calls):
+    '''Runs native rule language calls, as few irule runs as the rule text
+    length limit allows
+    '''
+    irule = IrodsRule()
+
+    invalidate_catalog_cache(module)
+
+    chunks = []
+    for call in calls:
+        if chunks and len(chunks[-1]) + len(call) + 2 <= _RULE_MAX_LEN:
+            chunks[-1] += '; ' + call
+        else:
+            chunks.append(call)
+
+    for text in chunks:
+        cmd = ['-r', _RULE_LANGUAGE_INSTANCE, text, 'null', 'ruleExecOut']
+        r, o, e = module.run_command(irule(cmd))
+
+        if r != 0:
+            module.fail_json(
+                msg='irule cmd=\'%s\' failed with code=%s error=\'%s\'' %
+                (cmd, r, e)
+            )
+
+
+def get_collections(module, paths):
+    '''Returns the set of existing collections among paths
+    '''
+    # zones hold millions of collections, never scan them all
+    return set(
+        row['COLL_NAME']
+        for row in select_in(module, ['COLL_NAME'], 'COLL_NAME', paths,
+                             max_queries=None)
+    )
+
+
+def pivot_quotas(rows):
+    '''Returns logical quotas AVU rows as dicts of result keys (see
+    _QUOTA_FIELDS) indexed by collection
+    '''
+    attrs = {v: k for k, v in _QUOTA_FIELDS.items()}
+
+    quotas = {}
+    for row in rows:
+        if row['META_COLL_ATTR_NAME'] in attrs:
+            quotas.setdefault(row['COLL_NAME'], {})[
+                attrs[row['META_COLL_ATTR_NAME']]] = row['META_COLL_ATTR_VALUE']
+
+    return quotas
+
+
+def get_collection_quotas(module, paths):
+    '''Returns the logical quotas of collections among paths, see
+    pivot_quotas()
+    '''
+    return pivot_quotas(select_in(
+        module,
+        _QUOTA_AVU_FIELDS,
+        'COLL_NAME',
+        paths,
+        [_QUOTA_AVU_WHERE],
+    ))
+
+
+def _ratio(total, limit):
+    try:
+        total, limit = int(total), int(limit)
+    except ValueError:
+        return None
+
+    if limit <= 0:
+        return None
+
+    return round(100.0 * total / limit, 2)
+
+
+def quota_report(module):
+    '''Returns the logical quotas of all collections under `prefix`, with
+    their utilisation, from a single catalog query
+    '''
+    where = [_QUOTA_AVU_WHERE]
+
+    prefix = module.params['prefix']
+    if prefix:
+        prefix = prefix.rstrip('/')
+        # '_' and '%' of prefix are wildcards, filtered below
+        where.append(('COLL_NAME', 'like', prefix + '%'))
+
+    rows = irods_quest(module).iter_select(module, _QUOTA_AVU_FIELDS, where)
+
+    report = []
+    for path, quotas in pivot_quotas(rows).items():
+        if prefix and path != prefix and not path.startswith(prefix + '/'):
+            continue
+
+        status = dict(collection=path)
+        for k in _QUOTA_FIELDS:
+            status[k] = quotas.get(k, '')
+
+        status['bytes_utilisation'] = _ratio(status['total_bytes'],
+                                             status['bytes_limit'])
+        status['files_utilisation'] = _ratio(status['total_files'],
+                                             status['files_limit'])
+
+        ratios = [
+            r for r in (status['bytes_utilisation'], status['files_utilisation'])
+            if r is not None
+        ]
+        status['utilisation'] = max(ratios) if ratios else None
+
+        report.append(status)
+
+    report.sort(key=lambda status: status['collection'])
+
+    if module.params['sort'] == 'utilisation':
+        # most used first, collections without limits last
+        report.sort(key=lambda status: (status['utilisation'] is None,
+                                        -(status['utilisation'] or 0)))
+
+    return report
+
+
+def is_monitored(quotas):
+    '''Tells whether logical quotas AVUs are those of a monitored collection
+    '''
+    # totals are set when monitoring starts
+    return 'total_bytes' in quotas and 'total_files' in quotas
+
+
+def reconcile_collections(module, result):
+    '''Sets the limits of all collections of the `collections` option
+    '''
+    wanted = {}
+    for c in module.params['collections']:
+        wanted[c['collection'].rstrip('/') or '/'] = c
+
+    paths = list(wanted)
+
+    snapshot = load_catalog_snapshot(
+        module,
+        existing=lambda m: get_collections(m, paths),
+        quotas=lambda m: get_collection_quotas(m, paths),
+    )
+
+    missing = sorted(set(paths) - snapshot.existing)
+    if missing:
+        module.fail_json(msg='collections not found: %s' % ', '.join(missing))
+
+    calls = []
+    start = []
+    result['collections'] = []
+
+    for path in paths:
+        status = dict(collection=path, changed=False)
+        current = snapshot.quotas.get(path, {})
+
+        for k in _QUOTA_FIELDS:
+            status[k] = current.get(k, '')
+
+        if is_monitored(current):
+            status['monitoring'] = 'monitored'
+        else:
+            status['monitoring'] = 'started'
+            start.append(path)
+
+        for k, operation in _LIMIT_OPERATIONS.items():
+            value = wanted[path].get(k)
+
+            if value and value != status[k]:
+                calls.append(rule_call(operation, path, value))
+                status[k] = value
+                status['changed'] = True
+
+        result['collections'].append(status)
+
+    if module.params['report_only']:
+        return
+
+    result['changed'] = bool(calls)
+
+    if module.check_mode or not (start or calls):
+        return
+
+    add_specific_query_logical_quotas(module)
+
+    # start monitoring before setting limits
+    invoke_rule_calls(module, [
+        rule_call('logical_quotas_start_monitoring_collection', path)
+        for path in start
+    ] + calls)
+
+    remember_specific_queries(module)
+
+
+def job_file(module, job_id):
+    if os.path.basename(job_id) != job_id or job_id in ('', '.', '..'):
+        module.fail_json(msg='invalid job id %s' % job_id)
+
+    return os.path.join(os.path.expanduser(module.params['jobs_dir']),
+                        job_id + '.json')
+
+
+def write_job(path, job):
+    '''Writes the job status file, atomically for readers
+    '''
+    fd, tmp = mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(fd, 'w') as f:
+        json.dump(job, f)
+
+    os.rename(tmp, path)
+
+
+def read_job(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, IOError, ValueError):
+        return None
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        # EPERM: the job runs as another user
+        return e.errno == errno.EPERM
+
+    return True
+
+
+def job_running(job):
+    return not job['finished'] and _process_alive(job['pid'])
+
+
+def run_job(module, path, job):
+    '''Runs the recalculation rule on the collections of job, updating its
+    status file as collections complete
+    '''
+    lock = threading.Lock()
+    irule = IrodsRule()
+
+    def recalculate(worker, collection):
+        status = job['collections'][collection]
+
+        with lock:
+            status['status'] = 'running'
+            write_job(path, job)
+
+        rule = dict(operation=job['operation'], collection=collection)
+        cmd = ['-r', _LOGICAL_QUOTAS_INSTANCE, json.dumps(rule), 'null',
+               'ruleExecOut']
+        # run_command() rewrites os.environ, it is not thread safe
+        r, o, e = run_process(module, irule(cmd))
+
+        with lock:
+            status['status'] = 'ok' if r == 0 else 'failed'
+            status['msg'] = e.strip() if r != 0 else ''
+            write_job(path, job)
+
+    try:
+        map_concurrently(module, recalculate, sorted(job['collections']),
+                         module.params['concurrency'])
+    except BaseException as e:
+        # fail_json() exits too, the job must not be reported as running
+        job['msg'] = str(e) if isinstance(e, Exception) else 'interrupted'
+        raise
+    finally:
+        job['finished'] = True
+        job['ended'] = int(time.time())
+        write_job(path, job)
+
+        # totals AVUs were rewritten
+        invalidate_catalog_cache(module)
+        remember_specific_queries(module)
+
+
+def recalculate_collections(module, result, paths):
+    '''Runs a recalculation job on paths, its progress is polled with
+    job_status() from other runs of the module
+    '''
+    missing = sorted(set(paths) - get_collections(module, paths))
+    if missing:
+        module.fail_json(msg='collections not found: %s' % ', '.join(missing))
+
+    result['changed'] = True
+
+    if module.check_mode:
+        return
+
+    jobs_dir = os.path.expanduser(module.params['jobs_dir'])
+    try:
+        os.makedirs(jobs_dir, mode=0o700, exist_ok=True)
+    except OSError as e:
+        module.fail_json(msg='cannot create %s: %s' % (jobs_dir, e))
+
+    job_id = module.params['job_id'] or uuid.uuid4().hex
+    path = job_file(module, job_id)
+
+    previous = read_job(path)
+    if previous is not None and job_running(previous):
+        module.fail_json(msg='job %s is running' % job_id)
+
+    # the rules count data objects with the specific queries
+    add_specific_query_logical_quotas(module)
+
+    # the pid is known as soon as the job is, a job without status file did
+    # not start
+    job = dict(
+        job_id=job_id,
+        operation=_RECALCULATE_OPERATIONS[module.params['recalculate']],
+        pid=os.getpid(),
+        started=int(time.time()),
+        ended=None,
+        finished=False,
+        collections={
+            p: dict(status='pending', msg='') for p in paths
+        },
+    )
+    write_job(path, job)
+
+    run_job(module, path, job)
+
+    report_job(module, result, path, job)
+
+
+def report_job(module, result, path, job):
+    '''Fills result with the status of job, failing when it failed
+    '''
+    result['job_id'] = job['job_id']
+    result['finished'] = job['finished']
+    result['results_file'] = path
+    result['job'] = job
+
+    if not job['finished'] and not _process_alive(job['pid']):
+        module.fail_json(msg='job %s died' % job['job_id'], **result)
+
+    if job.get('msg'):
+        module.fail_json(msg='job %s failed: %s' % (job['job_id'], job['msg']),
+                         **result)
+
+    failed = sorted(
+        p for p, status in job['collections'].items()
+        if status['status'] == 'failed'
+    )
+
+    if job['finished'] and failed:
+        module.fail_json(
+            msg='recalculation failed for collections: %s' % ', '.join(failed),
+            **result
+        )
+
+
+def job_status(module, result):
+    '''Reports the status of the job of the `job_id` option
+    '''
+    path = job_file(module, module.params['job_id'])
+
+    job = read_job(path)
+    if job is None:
+        module.fail_json(msg='job %s not found' % module.params['job_id'])
+
+    report_job(module, result, path, job)
+
+
+def cleanup_job(module, result):
+    '''Removes the status file of the job of the `job_id` option, like
+    async_status mode=cleanup
+    '''
+    path = job_file(module, module.params['job_id'])
+    result['job_id'] = module.params['job_id']
+    result['results_file'] = path
+
+    job = read_job(path)
+    if job is None:
+        return
+
+    if job_running(job):
+        module.fail_json(msg='job %s is running' % job['job_id'], **result)
+
+    result['changed'] = True
+
+    if not module.check_mode:
+        try:
+            os.remove(path)
+        except OSError as e:
+            module.fail_json(msg='cannot remove %s: %s' % (path, e), **result)
+
+
 def main():
     rule = {}
     module_args = dict(
-        collection=dict(type='str', required=True),
+        collection=dict(type='str', required=False),
+        collections=dict(
+            type='list',
+            elements='dict',
+            options=dict(
+                collection=dict(type='str', required=True),
+                bytes_limit=dict(type='str', required=False),
+                files_limit=dict(type='str', required=False),
+            ),
+        ),
         bytes_limit=dict(type='str', required=False),
         files_limit=dict(type='str', required=False),
-        report_only=dict(type='bool', required=False, default=False)
+        report_only=dict(type='bool', required=False, default=False),
+        recalculate=dict(
+            type='str',
+            required=False,
+            choices=list(_RECALCULATE_OPERATIONS),
+        ),
+        concurrency=dict(type='int', default=4, required=False),
+        job_id=dict(type='str', required=False),
+        cleanup=dict(type='bool', default=False, required=False),
+        jobs_dir=dict(
+            type='path',
+            default='~/.cache/mcia_irods/jobs',
+            required=False,
+        ),
+        report=dict(type='bool', default=False, required=False),
+        prefix=dict(type='str', required=False),
+        sort=dict(
+            type='str',
+            default='utilisation',
+            required=False,
+            choices=['utilisation', 'collection'],
+        ),
     )
+    module_args.update(irods_common_argument_spec())
 
     module = AnsibleModule(
         argument_spec=module_args,
+        mutually_exclusive=[
+            ('collection', 'collections'),
+        ],
+        required_if=[
+            ('report', False, ('collection', 'collections', 'job_id'), True),
+            ('cleanup', True, ('job_id',)),
+        ],
         supports_check_mode=True
     )
+    instrument_module(module)
+
+    if module.params['report']:
+        excluded = [name for name in ('collection', 'collections', 'job_id')
+                    if module.params[name] is not None]
+        if excluded:
+            module.fail_json(msg='parameters are mutually exclusive: '
+                             'report|%s' % '|'.join(excluded))
+
+        result = dict(changed=False, report=quota_report(module))
+        module.exit_json(**result)
+
+    paths_given = (module.params['collection'] is not None
+                   or module.params['collections'] is not None)
+
+    if module.params['cleanup'] and (paths_given
+                                     or module.params['recalculate']):
+        module.fail_json(msg='cleanup only applies to job_id')
+
+    if module.params['recalculate'] is None and module.params['job_id'] is not None:
+        if paths_given:
+            module.fail_json(msg='job_id only names the job of recalculate')
+
+        result = dict(changed=False)
+        if module.params['cleanup']:
+            cleanup_job(module, result)
+        else:
+            job_status(module, result)
+        module.exit_json(**result)
+
+    if module.params['recalculate'] is not None:
+        if not paths_given:
+            module.fail_json(msg='recalculate requires collection or '
+                             'collections')
+
+        result = dict(changed=False)
+
+        if module.params['collections'] is not None:
+            paths = [c['collection'] for c in module.params['collections']]
+        else:
+            paths = [module.params['collection']]
+
+        recalculate_collections(module, result,
+                                [p.rstrip('/') or '/' for p in paths])
+        module.exit_json(**result)
+
+    if module.params['collections'] is not None:
+        result = dict(changed=False)
+        reconcile_collections(module, result)
+        module.exit_json(**result)
+
+    # catalog paths have no trailing slash, the AVUs would not match
+    module.params['collection'] = module.params['collection'].rstrip('/') or '/'
 
     result = dict(
         changed=False,
@@ -226,24 +962,36 @@ def main():
     if not module.params['report_only'] and module.check_mode is not True:
         add_specific_query_logical_quotas(module) 
 
+    quotas = get_collection_quotas(module, [module.params['collection']])
+
+    if any(is_monitored(q) for q in quotas.values()):
+        result['monitoring'] = 'monitored'
+    else:
+        result['monitoring'] = 'started'
+
     # start monitoring (even in report_only otherwise get_collection_status fails)
-    if module.check_mode is not True:
+    if module.check_mode is not True and result['monitoring'] == 'started':
+        invalidate_catalog_cache(module)
         rule['operation'] = 'logical_quotas_start_monitoring_collection'
         rule['collection'] = module.params['collection']
         invoke_rule(module, rule)
 
-
-    # get initial collection status
-    rule['operation']='logical_quotas_get_collection_status'
-    rule['collection']=module.params['collection']
-    rule_output = invoke_rule(module, rule)
-    initial_collection_status = json.loads(invoke_rule(module, rule))
-    # store result status
-    for k, v in _QUOTA_FIELDS.items():
-        if v in initial_collection_status:
-            result[k] = initial_collection_status[v]
-        else:
-            result[k] = ""
+    if result['monitoring'] == 'started':
+        # get initial collection status
+        rule['operation']='logical_quotas_get_collection_status'
+        rule['collection']=module.params['collection']
+        initial_collection_status = json.loads(invoke_rule(module, rule))
+        # store result status
+        for k, v in _QUOTA_FIELDS.items():
+            if v in initial_collection_status:
+                result[k] = initial_collection_status[v]
+            else:
+                result[k] = ""
+    else:
+        # already read from the collection AVUs
+        for q in quotas.values():
+            for k in _QUOTA_FIELDS:
+                result[k] = q.get(k, "")
 #    result['bytes_limit'] = initial_collection_status['irods::logical_quotas::maximum_size_in_bytes']
 #    result['files_limit'] = initial_collection_status['irods::logical_quotas::maximum_number_of_data_objects']
 #    result['total_bytes'] = initial_collection_status['irods::logical_quotas::total_size_in_bytes']
@@ -264,6 +1012,7 @@ def main():
     if not module.check_mode and not module.params['report_only']:
         # set quota max size
         if module.params['bytes_limit'] and module.params['bytes_limit'] != result['bytes_limit']:
+            invalidate_catalog_cache(module)
             rule['operation'] = 'logical_quotas_set_maximum_size_in_bytes'
             rule['collection'] = module.params['collection']
             rule['value'] = module.params['bytes_limit']
@@ -273,6 +1022,7 @@ def main():
 
         # set quota max files
         if module.params['files_limit'] and module.params['files_limit'] != result['files_limit']:
+            invalidate_catalog_cache(module)
             rule['operation'] = 'logical_quotas_set_maximum_number_of_data_objects'
             rule['collection'] = module.params['collection']
             rule['value'] = module.params['files_limit']
@@ -280,6 +1030,7 @@ def main():
             result['files_limit'] = module.params['files_limit']
             result['changed'] = True
 
+        remember_specific_queries(module)
 
     module.exit_json(**result)
 
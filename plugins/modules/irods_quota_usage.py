@@ -0,0 +1,316 @@
+#! /usr/bin/python
+
+
+DOCUMENTATION = r'''
+---
+module: irods_quota_usage
+
+short_description: gather iRODS quota usage
+
+description:
+  - "Returns the usage of each user and group quota against its limit, as
+     last computed by the iRODS quota usage recalculation (`iadmin cu`)."
+  - "Recalculation goes through the whole catalog. It is only run when the
+     previous one is older than `max_age`, or when more than
+     `max_changed_objects` data objects were modified since then, and never
+     when no quota is set."
+  - "To use this module, `become_user` must be set to a unix user configured to
+     have access to a rodsadmin iRODS user."
+
+options:
+  zone:
+    description: name of iRODS zone
+    required: false
+    type: str
+    default: <local zone>
+  names:
+    description: names of the users and groups to report, all if unset
+    required: false
+    type: list
+    elements: str
+  recalculate:
+    description:
+      - "`auto` recalculates usage according to `max_age` and
+         `max_changed_objects`, if any quota is reported. `always` and
+         `never` do as they say."
+    required: false
+    type: str
+    choices: [auto, always, never]
+    default: auto
+  max_age:
+    description: maximum age in seconds of the last usage recalculation
+    required: false
+    type: int
+    default: 86400
+  max_changed_objects:
+    description:
+      - "maximum number of data objects modified since the last usage
+         recalculation"
+    required: false
+    type: int
+    default: 10000
+
+extends_documentation_fragment:
+  - mcia.irods.common
+  - mcia.irods.common.trace
+
+author:
+  - "Pierre Gay (@pigay)"
+'''
+
+EXAMPLES = r'''
+- name: get quota usage, recalculated at most once an hour
+  mcia.irods.irods_quota_usage:
+    max_age: 3600
+
+- name: show users over quota
+  debug:
+    msg: "{{ irods_quota_usage.quotas | selectattr('over', 'gt', 0) }}"
+'''
+
+RETURN = r'''
+ansible_facts:
+  description: quota usage facts
+  returned: success
+  type: dict
+  contains:
+    irods_quota_usage:
+      description: quota usage
+      type: dict
+      contains:
+        quotas:
+          description: usage of each quota
+          type: list
+          elements: dict
+          contains:
+            name:
+              description: user or group name
+              type: str
+            zone:
+              description: user or group zone
+              type: str
+            type:
+              description: user type (rodsuser, rodsgroup...)
+              type: str
+            resource:
+              description: resource name, `total` for all resources
+              type: str
+            limit:
+              description: quota limit in bytes
+              type: int
+            usage:
+              description: used bytes
+              type: int
+            over:
+              description: bytes over the limit, negative when under
+              type: int
+        last_recalculation:
+          description: epoch time of the last usage recalculation
+          type: int
+        changed_objects:
+          description:
+            - "number of data objects modified since the last
+               recalculation, when counted"
+          type: int
+        recalculated:
+          description: whether usage was recalculated by this run
+          type: bool
+        reason:
+          description: why usage was recalculated or not
+          type: str
+'''
+
+import time
+
+from ansible.module_utils.basic import AnsibleModule
+
+from ansible_collections.mcia.irods.plugins.module_utils.irods_utils import (
+    irods_common_argument_spec,
+    irods_quest,
+    load_catalog_snapshot,
+    local_zone,
+    run_iadmin_batch,
+    select_in,
+    zone_where,
+    instrument_module,
+)
+
+_QUOTA_USAGE_FIELDS = [
+    'QUOTA_USER_NAME',
+    'QUOTA_USER_ZONE',
+    'QUOTA_USER_TYPE',
+    'QUOTA_RESC_ID',
+    'QUOTA_LIMIT',
+    'QUOTA_OVER',
+]
+
+_LAST_RECALCULATION_FIELD = 'max(QUOTA_USAGE_MODIFY_TIME)'
+
+_CHANGED_OBJECTS_FIELD = 'count(DATA_ID)'
+
+
+def get_quota_usage(module):
+    '''Returns catalog quotas with their limit and the bytes over it
+    '''
+    where = zone_where(module, 'QUOTA_USER_ZONE')
+
+    if module.params['names'] is None:
+        rows = irods_quest(module).iter_select(module, _QUOTA_USAGE_FIELDS,
+                                               where)
+    else:
+        rows = select_in(module, _QUOTA_USAGE_FIELDS, 'QUOTA_USER_NAME',
+                         module.params['names'], where)
+
+    return list(rows)
+
+
+def _epoch(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def last_recalculation(module):
+    '''Returns the epoch time of the last quota usage recalculation, None if
+    usage was never computed
+    '''
+    for row in irods_quest(module).iter_select(
+            module, [_LAST_RECALCULATION_FIELD]):
+        return _epoch(row[_LAST_RECALCULATION_FIELD])
+
+    return None
+
+
+def changed_objects(module, since):
+    '''Returns the number of data objects modified after epoch time `since`
+    '''
+    # catalog times are zero padded epoch strings
+    where = [('DATA_MODIFY_TIME', '>', '%011d' % since)]
+
+    for row in irods_quest(module).iter_select(
+            module, [_CHANGED_OBJECTS_FIELD], where):
+        return _epoch(row[_CHANGED_OBJECTS_FIELD]) or 0
+
+    return 0
+
+
+def needs_recalculation(module, facts, now, quotas):
+    '''Tells whether quota usage has to be recalculated, and why
+    '''
+    params = module.params
+    last = facts['last_recalculation']
+
+    if params['recalculate'] != 'auto':
+        return params['recalculate'] == 'always', 'recalculate=%s' % (
+            params['recalculate'])
+
+    if not quotas:
+        # usage is never recorded then, recalculating would not change that
+        return False, 'no quotas'
+
+    if last is None:
+        return True, 'usage never computed'
+
+    if now - last > params['max_age']:
+        return True, 'last recalculation older than %ss' % params['max_age']
+
+    # only counted when the age does not decide
+    facts['changed_objects'] = changed_objects(module, last)
+
+    if facts['changed_objects'] > params['max_changed_objects']:
+        return True, '%s data objects changed since last recalculation' % (
+            facts['changed_objects'])
+
+    return False, 'usage up to date'
+
+
+def quota_usage_facts(rows, rescs):
+    quotas = []
+
+    for row in rows:
+        # id 0 stands for total (all resources) quotas
+        rid = row['QUOTA_RESC_ID']
+        limit = row['QUOTA_LIMIT'] or 0
+        over = row['QUOTA_OVER'] or 0
+
+        quotas.append(dict(
+            name=row['QUOTA_USER_NAME'],
+            zone=row['QUOTA_USER_ZONE'],
+            type=row['QUOTA_USER_TYPE'],
+            resource='total' if rid == 0 else rescs.get(rid, str(rid)),
+            limit=limit,
+            usage=limit + over,
+            over=over,
+        ))
+
+    return sorted(quotas, key=lambda q: (q['name'], q['resource']))
+
+
+def main():
+    module_args = dict(
+        zone=dict(type='str', required=False),
+        names=dict(type='list', elements='str', required=False),
+        recalculate=dict(
+            type='str',
+            default='auto',
+            required=False,
+            choices=['auto', 'always', 'never'],
+        ),
+        max_age=dict(type='int', default=86400, required=False),
+        max_changed_objects=dict(type='int', default=10000, required=False),
+    )
+    module_args.update(irods_common_argument_spec())
+
+    module = AnsibleModule(
+        argument_spec=module_args,
+        supports_check_mode=True
+    )
+    instrument_module(module)
+
+    result = dict(
+        changed=False,
+    )
+
+    # we need a zone to ensure we get unique users
+    if module.params['zone'] is None:
+        # default to local zone (must be only one)
+        module.params['zone'] = local_zone(module)
+
+    snapshot = load_catalog_snapshot(
+        module,
+        ['rescs'],
+        quotas=get_quota_usage,
+        last_recalculation=last_recalculation,
+    )
+
+    facts = dict(
+        last_recalculation=snapshot.last_recalculation,
+        changed_objects=None,
+        recalculated=False,
+    )
+
+    recalculate, facts['reason'] = needs_recalculation(module, facts,
+                                                       int(time.time()),
+                                                       snapshot.quotas)
+    rows = snapshot.quotas
+
+    if recalculate:
+        result['changed'] = True
+
+        if not module.check_mode:
+            run_iadmin_batch(module, [['cu']])
+
+            facts['recalculated'] = True
+            facts['last_recalculation'] = last_recalculation(module)
+            rows = get_quota_usage(module)
+
+    facts['quotas'] = quota_usage_facts(rows, snapshot.rescs)
+
+    result['ansible_facts'] = dict(irods_quota_usage=facts)
+
+    module.exit_json(**result)
+
+
+if __name__ == '__main__':
+    main()
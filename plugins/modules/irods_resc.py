@@ -49,6 +49,22 @@ options:
         description: list of resource children trees (if appropriate)
         type: list
         required: false
+  concurrency:
+    description:
+      - "Maximum number of iadmin sessions run in parallel to apply changes.
+         Changes are applied in waves of operations on unrelated resources,
+         parent/child links being set once both resources exist, and broken
+         before resources are removed. `1` applies all changes through a
+         single iadmin session, each wave only once the previous ones
+         succeeded."
+    required: false
+    type: int
+    default: 1
+
+extends_documentation_fragment:
+  - mcia.irods.common
+  - mcia.irods.common.trace
+  - mcia.irods.common.diff
 
 author:
     - "Pierre Gay (@pigay)"
@@ -80,13 +96,14 @@ EXAMPLES = r'''
 from ansible.module_utils.basic import AnsibleModule
 
 from ansible_collections.mcia.irods.plugins.module_utils.irods_utils import (
-    IrodsQuest,
-    resc_trees,
-    clean_hierarchy,
+    irods_common_argument_spec,
+    irods_diff_argument_spec,
+    load_catalog_snapshot,
     params_to_hierarchy,
-    dump_hierarchies,
+    diff_hierarchies,
     compare_hierarchies,
     match_hierarchies,
+    instrument_module,
 )
 
 
@@ -94,18 +111,22 @@ def main():
     module_args = dict(
         zone=dict(type='str', required=False),
         roots=dict(type='list', required=True),
+        concurrency=dict(type='int', default=1, required=False),
     )
+    module_args.update(irods_common_argument_spec())
+    module_args.update(irods_diff_argument_spec())
 
     module = AnsibleModule(
         argument_spec=module_args,
         supports_check_mode=True
     )
+    instrument_module(module)
 
     result = dict(
         changed=False
     )
 
-    got = resc_trees(module)
+    got = load_catalog_snapshot(module, ['resc_trees']).resc_trees
     wanted = params_to_hierarchy(module.params['roots'], module.params['zone'])
 
     # match wildcard patterns in wanted hierarchy
@@ -115,16 +136,14 @@ def main():
         result['changed'] = True
 
     if module._diff:
-        result['diff'] = dict(
-            before=dump_hierarchies(got),
-            after=dump_hierarchies(wanted)
-        )
+        result['diff'] = diff_hierarchies(module, got, wanted)
 
     if module.check_mode or not result['changed']:
         module.exit_json(**result)
 
     # make changes
-    result['compare'] = compare_hierarchies(module, got, wanted)
+    result['compare'] = compare_hierarchies(module, got, wanted,
+                                            module.params['concurrency'])
 
     module.exit_json(**result)
 
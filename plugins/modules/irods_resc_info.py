@@ -16,6 +16,10 @@ options:
     required: false
     type: str
 
+extends_documentation_fragment:
+  - mcia.irods.common
+  - mcia.irods.common.trace
+
 author:
     - Pierre Gay
 '''
@@ -66,7 +70,9 @@ resc_trees:
 from ansible.module_utils.basic import AnsibleModule
 
 from ansible_collections.mcia.irods.plugins.module_utils.irods_utils import (
-    IrodsQuest, resc_trees
+    irods_common_argument_spec,
+    load_catalog_snapshot,
+    instrument_module,
 )
 
 
@@ -74,15 +80,19 @@ def main():
     module_args = dict(
         zone=dict(type='str', required=False),
     )
+    module_args.update(irods_common_argument_spec())
 
     module = AnsibleModule(
         argument_spec=module_args,
         supports_check_mode=True
     )
+    instrument_module(module)
 
     result = dict(
         changed=False,
-        resc_trees=resc_trees(module)
+        resc_trees=load_catalog_snapshot(
+            module, ['resc_trees']
+        ).resc_trees.to_dicts(),
     )
 
     module.exit_json(**result)
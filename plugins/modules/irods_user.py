@@ -10,6 +10,9 @@ short_description: configure iRODS users
 description:
   - "Configures iRODS users provided in the `name` or `names` option according
      to `state`"
+  - "Alternatively, the `users` option describes each user separately. All
+     users are then reconciled with a single catalog query and their changes
+     applied in a single iadmin session."
   - "To use this module, `become_user` must be set to a unix user configured to
      have access to a rodsadmin iRODS user."
 
@@ -27,6 +30,36 @@ options:
     description: list of iRODS user names
     required: true
     type: list[str]
+  users:
+    description:
+      - "List of iRODS users, each with its own `type`, `info`, `comment` and
+         `state`. Unset user options default to the module options."
+    required: false
+    type: list
+    elements: dict
+    suboptions:
+      name:
+        description: name of iRODS user
+        required: true
+        type: str
+      state:
+        description: state
+        required: false
+        type: str
+        choices: [present, absent]
+      type:
+        description: user type
+        required: false
+        type: str
+        choices: [rodsadmin, rodsgroup, rodsuser]
+      info:
+        description: enforced `user_info` of the user
+        required: false
+        type: str
+      comment:
+        description: enforced `r_comment` of the user
+        required: false
+        type: str
   state:
     description: state
     required: false
@@ -51,6 +84,11 @@ options:
     required: false
     type: str
 
+extends_documentation_fragment:
+  - mcia.irods.common
+  - mcia.irods.common.trace
+  - mcia.irods.common.diff
+
 author:
     - "Pierre Gay (@pigay)"
 '''
@@ -64,25 +102,35 @@ EXAMPLES = r'''
     type: rodsuser
     state: present
     info: "created with Ansible"
+
+- name: synchronize iRODS users with a directory
+  mcia.irods.irods_user:
+    users:
+      - name: alice
+        comment: "Alice Liddell"
+      - name: bob
+        type: rodsadmin
+      - name: carol
+        state: absent
+    info: "synchronized by Ansible"
 '''
 
 from ansible.module_utils.basic import AnsibleModule
 
 from ansible_collections.mcia.irods.plugins.module_utils.irods_utils import (
-    IrodsQuest,
-    IrodsAdmin,
-    get_zones,
+    IrodsAdminSession,
+    irods_common_argument_spec,
+    irods_diff_argument_spec,
+    add_user_cmd,
+    delete_user_cmd,
+    get_users,
+    load_catalog_snapshot,
+    local_zone,
+    modify_user_cmd,
+    render_diff,
+    instrument_module,
 )
 
-_USER_FIELDS = [
-    'USER_ID',
-    'USER_NAME',
-    'USER_TYPE',
-    'USER_ZONE',
-    'USER_INFO',
-    'USER_COMMENT',
-]
-
 _USER_PARAM_FIELDS = {
     'zone': 'USER_ZONE',
     'type': 'USER_TYPE',
@@ -90,123 +138,111 @@ _USER_PARAM_FIELDS = {
     'info': 'USER_INFO',
 }
 
-_MODUSER_PARAMS = {v: k for k, v in _USER_PARAM_FIELDS.items()}
-
-def get_users(module):
-    iquest = IrodsQuest()
-
-    fmt = ':'.join(['%s'] * len(_USER_FIELDS))
-
-    cmd = 'select ' + ', '.join(_USER_FIELDS)
-    if (module.params['zone'] is not None):
-        cmd += ' where USER_ZONE = \'%s\'' % module.params['zone']
-
-    r, o, e = module.run_command(iquest(['--no-page', fmt, cmd]))
-
-    if r != 0:
-        module.fail_json(
-            msg='iquest cmd=\'%s\' failed with code=%s error=\'%s\'' %
-            (cmd, r, e)
-        )
-
-    if 'CAT_NO_ROWS_FOUND' in o:
-        return {}
-
-    users = {}
-
-    for l in o.strip().split('\n'):
-        values = l.strip().split(':')
-        user = dict(zip(_USER_FIELDS, values))
-        users[user['USER_NAME']] = user
-
-    return users
 
 def params_to_users(params):
+    '''Returns users to be present indexed by name, and the set of user
+    names to be absent
+    '''
     skel = {}
 
     for k, v in _USER_PARAM_FIELDS.items():
         if params[k] is not None:
             skel[v] = params[k]
- 
-    if params['names'] is not None:
-        names = params['names']
+
+    if params['users'] is not None:
+        entries = params['users']
+    elif params['names'] is not None:
+        entries = [dict(name=name) for name in params['names']]
     elif params['name'] is not None:
-        names = [params['name']]
+        entries = [dict(name=params['name'])]
     else:
         raise Exception("No username given (Should not happen according to module logic)")
 
     users = {}
+    absent = set()
+
+    for entry in entries:
+        name = entry['name']
+
+        if (entry.get('state') or params['state']) == 'absent':
+            users.pop(name, None)
+            absent.add(name)
+            continue
 
-    for name in names:
         u = skel.copy()
+        for k, v in _USER_PARAM_FIELDS.items():
+            if entry.get(k) is not None:
+                u[v] = entry[k]
         u['USER_NAME'] = name
+
         users[name] = u
+        absent.discard(name)
 
-    return users
+    return users, absent
 
 
-def users_to_string(users):
-    return '\n'.join([
-        ':'.join([k + '=' + v for k, v in sorted(u.items())])
-        for u in users.values()
-    ]) + '\n'
+def users_to_lines(users):
+    return {
+        name: ':'.join([k + '=' + str(v) for k, v in sorted(u.items())])
+        for name, u in users.items()
+    }
 
 
-def delete_user(module, user):
-    iadmin = IrodsAdmin()
+def user_operations(got, wanted):
+    '''Returns the (description, iadmin command) list turning got users
+    into wanted users
+    '''
+    operations = []
 
-    user_name = user['USER_NAME']
-    if user['USER_TYPE'] == 'rodsgroup':
-        cmd = ['rmgroup', user_name]
-    else:
-        if 'USER_ZONE' in user:
-            user_name += '#' + user['USER_ZONE']
-        cmd = ['rmuser', user_name]
-    r, o, e = module.run_command(iadmin(cmd))
-
-    if r != 0:
-        module.fail_json(
-            msg='iadmin cmd=\'%s\' failed with code=%s error=\'%s\'' %
-            (cmd, r, e)
-        )
+    for k, v in got.items():
+        if k not in wanted:
+            operations.append(('delete %s' % k, delete_user_cmd(v)))
 
+    for k, v in wanted.items():
+        if k in got:
+            for attr, value in v.items():
+                if got[k][attr] != value:
+                    operations.append((
+                        'mod %s %s %s' % (k, attr, value),
+                        modify_user_cmd(k, attr, value),
+                    ))
+        else:
+            operations.append(('add %s' % k, add_user_cmd(v)))
 
-def add_user(module, user):
-    iadmin = IrodsAdmin()
-
-    user_name = user['USER_NAME']
-    if user['USER_TYPE'] == 'rodsgroup':
-        cmd = ['mkgroup', user_name]
-    else:
-        if 'USER_ZONE' in user:
-            user_name += '#' + user['USER_ZONE']
-        cmd = ['mkuser', user_name , user['USER_TYPE']]
-    r, o, e = module.run_command(iadmin(cmd))
-
-    if r != 0:
-        module.fail_json(
-            msg='iadmin cmd=\'%s\' failed with code=%s error=\'%s\'' %
-            (cmd, r, e)
-        )
-
+            for attr in ['USER_COMMENT', 'USER_INFO']:
+                if attr in v:
+                    operations.append((
+                        'mod %s %s %s' % (k, attr, v[attr]),
+                        modify_user_cmd(k, attr, v[attr]),
+                    ))
 
-def modify_user(module, user, attr, value):
-    iadmin = IrodsAdmin()
+    return operations
 
-    cmd = ['moduser', user, _MODUSER_PARAMS[attr], value]
-    r, o, e = module.run_command(iadmin(cmd))
-
-    if r != 0:
-        module.fail_json(
-            msg='iadmin cmd=\'%s\' failed with code=%s error=\'%s\'' %
-            (cmd, r, e)
-        )
 
 def main():
     module_args = dict(
         zone=dict(type='str', required=False),
         name=dict(type='str'),
         names=dict(type='list', elements='str'),
+        users=dict(
+            type='list',
+            elements='dict',
+            options=dict(
+                name=dict(type='str', required=True),
+                state=dict(
+                    type='str',
+                    required=False,
+                    choices=['present', 'absent'],
+                ),
+                type=dict(
+                    type='str',
+                    required=False,
+                    choices=['rodsadmin', 'rodsgroup', 'rodsuser'],
+                ),
+                info=dict(type='str', required=False),
+                comment=dict(type='str', required=False),
+            ),
+        ),
         state=dict(
             type='str',
             default='present',
@@ -217,17 +253,20 @@ def main():
         info=dict(type='str', required=False),
         comment=dict(type='str', required=False),
     )
+    module_args.update(irods_common_argument_spec())
+    module_args.update(irods_diff_argument_spec())
 
     module = AnsibleModule(
         argument_spec=module_args,
         mutually_exclusive=[
-            ('name', 'names'),
+            ('name', 'names', 'users'),
         ],
         required_one_of=[
-            ('name', 'names'),
+            ('name', 'names', 'users'),
         ],
         supports_check_mode=True
     )
+    instrument_module(module)
 
     result = dict(
         changed=False,
@@ -237,62 +276,51 @@ def main():
     # we need a zone to ensure we get unique users
     if module.params['zone'] is None:
         # default to local zone (must be only one)
-        local_zone = get_zones(module, ZONE_TYPE='local')[0]
-        module.params['zone'] = local_zone['ZONE_NAME']
+        module.params['zone'] = local_zone(module)
 
-    got = get_users(module)
-    wanted = params_to_users(module.params)
+    wanted, absent = params_to_users(module.params)
 
-    # filter got users with those specified in params
-    got = {k: v.copy() for k, v in got.items() if k in wanted}
+    # only keep got users specified in params
+    names = set(wanted) | absent
+    snapshot = load_catalog_snapshot(
+        module,
+        users=lambda m: get_users(m, names),
+    )
+    got = snapshot.users
 
-    if module.params['state'] == 'absent':
-        wanted = {}
-    else:
-        for k, v in list(wanted.items()):
-            if k in got:
-                # initialize sers with catalog values
-                u = got[k].copy()
-                # overwrite with specified parameters
-                u.update(v)
-                wanted[k] = u
+    for k, v in list(wanted.items()):
+        if k in got:
+            # initialize users with catalog values
+            u = got[k].copy()
+            # overwrite with specified parameters
+            u.update(v)
+            wanted[k] = u
 
     if got != wanted:
         result['changed'] = True
 
     if module._diff:
-        result['diff'] = dict(
-            before=users_to_string(got),
-            after=users_to_string(wanted)
+        result['diff'] = render_diff(
+            module, users_to_lines(got), users_to_lines(wanted)
         )
 
     if module.check_mode or not result['changed']:
         module.exit_json(**result)
 
-    if module.params['state'] == 'absent':
-        for k, v in got.items():
-            delete_user(module, v)
-            result['operations'].append('delete %s' % k)
-    else:
-        for k, v in wanted.items():
-            if k in got:
-                for attr, value in v.items():
-                    if got[k][attr] != value:
-                        modify_user(module, k, attr, value)
-                        result['operations'].append(
-                            'mod %s %s %s' % (k, attr, value)
-                        )
-            else:
-                add_user(module, v)
-                result['operations'].append('add %s' % k)
-
-                for attr in ['USER_COMMENT', 'USER_INFO']:
-                    if attr in v:
-                        modify_user(module, k, attr, v[attr])
-                        result['operations'].append(
-                            'mod %s %s %s' % (k, attr, v[attr])
-                        )
+    # apply all changes in a single iadmin session, user modifications only
+    # once users are created
+    session = IrodsAdminSession(module)
+    operations = user_operations(got, wanted)
+
+    for phase in [False, True]:
+        for description, cmd in operations:
+            if (cmd[0] == 'moduser') == phase:
+                session.add(cmd)
+                result['operations'].append(description)
+
+        session.barrier()
 
+    session.run()
 
     module.exit_json(**result)
 
@@ -9,6 +9,8 @@ short_description: sets iRODS password for a user
 
 description:
   - "Modifies specified user's password in the catalog"
+  - "In bulk mode, the passwords of all `users` are verified concurrently
+     and the wrong ones are changed in a single iadmin session."
   - "To use this module, `become_user` must be set to a unix user configured to
      have access to a rodsadmin iRODS user."
 
@@ -34,6 +36,31 @@ options:
     description: iRODS password
     required: true
     type: str
+  users:
+    description: list of iRODS users and their password, for bulk mode
+    required: false
+    type: list
+    elements: dict
+    suboptions:
+      user:
+        description: name of iRODS user
+        required: true
+        type: str
+      password:
+        description: iRODS password
+        required: true
+        type: str
+  concurrency:
+    description:
+      - "maximum number of passwords verified at once, in-process
+         verifications only (see `auth_backend`), iinit runs one at a time"
+    required: false
+    type: int
+    default: 1
+
+extends_documentation_fragment:
+  - mcia.irods.common.auth
+  - mcia.irods.common.trace
 
 author:
   - "Pierre Gay (@pigay)"
@@ -45,29 +72,74 @@ EXAMPLES = r'''
     zone: demoZone
     user: demoUser
     password: SecretPassword
+
+- name: Set iRODS passwords of service accounts
+  mcia.irods.irods_user_password:
+    zone: demoZone
+    users:
+      - user: svc1
+        password: SecretPassword1
+      - user: svc2
+        password: SecretPassword2
+'''
+
+RETURN = r'''
+users:
+  description: verification result of each user, without passwords
+  returned: success
+  type: list
+  elements: dict
+  contains:
+    user:
+      description: name of iRODS user
+      type: str
+    verified:
+      description: whether the password was already set
+      type: bool
+    changed:
+      description: whether the password was changed
+      type: bool
 '''
 
 from ansible.module_utils.basic import AnsibleModule
 
 from ansible_collections.mcia.irods.plugins.module_utils.irods_utils import (
-    IrodsAdmin,
-    check_irods_password,
-    irods_env,
+    IrodsAdminSession,
+    icommands_check_password,
+    native_check_password,
+    instrument_module,
+    irods_auth_argument_spec,
+    irods_trace_argument_spec,
+    map_concurrently,
 )
 
 
-def change_irods_password(module, host, port, zone, user, password):
-    env = irods_env(host, port, zone)
+def check_irods_passwords(module, users, concurrency):
+    '''Verifies the passwords of (user, password) pairs, returns the list of
+    verdicts
+
+    In-process verifications run on a pool of `concurrency` threads. The
+    others run iinit one user at a time, since run_command() sets the user
+    and auth file variables in the environment of the whole process.
+    '''
+    p = module.params
 
-    iadmin = IrodsAdmin()
+    def check(worker, pair):
+        user, password = pair
+        return native_check_password(worker, p['host'], p['port'], p['zone'],
+                                     user, password, p['irods_version'],
+                                     p['ssl'])
 
-    r, o, e = module.run_command(iadmin(['moduser', user, 'password', password]))
+    verdicts = map_concurrently(module, check, users, concurrency)
 
-    if r != 0:
-        module.fail_json(
-            msg='iadmin failed with code=%s error=\'%s\'' %
-                (r, e)
-        )
+    for i, (user, password) in enumerate(users):
+        if verdicts[i] is None:
+            verdicts[i] = icommands_check_password(
+                module, p['host'], p['port'], p['zone'], user, password,
+                p['irods_version'], p['ssl']
+            )
+
+    return verdicts
 
 
 def main():
@@ -77,38 +149,65 @@ def main():
         zone=dict(type='str', required=False),
         user=dict(type='str'),
         password=dict(type='str', no_log=True),
+        users=dict(
+            type='list',
+            elements='dict',
+            options=dict(
+                user=dict(type='str', required=True),
+                password=dict(type='str', required=True, no_log=True),
+            ),
+        ),
+        concurrency=dict(type='int', default=1, required=False),
         ssl=dict(type='bool', default=True),
         irods_version=dict(type='str', default='4.2'),
     )
+    module_args.update(irods_auth_argument_spec())
+    module_args.update(irods_trace_argument_spec())
 
     module = AnsibleModule(
         argument_spec=module_args,
+        mutually_exclusive=[
+            ('user', 'users'),
+        ],
+        required_together=[
+            ('user', 'password'),
+        ],
+        required_one_of=[
+            ('user', 'users'),
+        ],
         supports_check_mode=True
     )
+    instrument_module(module)
 
     result = dict(
         changed=False,
         operations=[],
+        users=[],
     )
 
-    host = module.params['host']
-    port = module.params['port']
-    zone = module.params['zone']
-    user = module.params['user']
-    password = module.params['password']
-    ssl = module.params['ssl']
-    irods_version = module.params['irods_version']
+    if module.params['users'] is not None:
+        users = [(u['user'], u['password']) for u in module.params['users']]
+    else:
+        users = [(module.params['user'], module.params['password'])]
+
+    verdicts = check_irods_passwords(module, users,
+                                     module.params['concurrency'])
+
+    session = IrodsAdminSession(module)
 
-    ok = check_irods_password(module, host, port, zone, user, password,
-                              irods_version, ssl)
+    for (user, password), ok in zip(users, verdicts):
+        result['users'].append(dict(user=user, verified=ok, changed=not ok))
 
-    if not ok:
-        result['changed'] = True
+        if not ok:
+            result['changed'] = True
+            result['operations'].append('iadmin moduser %s password' % user)
+            session.add(['moduser', user, 'password', password])
 
     if module.check_mode or not result['changed']:
         module.exit_json(**result)
 
-    change_irods_password(module, host, port, zone, user, password)
+    # all passwords are changed in a single iadmin session
+    session.run()
 
     module.exit_json(**result)
 
@@ -22,7 +22,11 @@ options:
     type: str
     default: <local zone>
   limits:
-    description: dictionary of limit per user/group
+    description:
+      - "dictionary of limit per user/group, applied to `resource`"
+      - "A user/group can instead be given a dictionary of limit per
+         resource name, so that all quotas of a user × resource matrix are
+         set in a single run."
     required: true
     type: dict(int)
   resource:
@@ -31,6 +35,11 @@ options:
     type: str
     default: "total"
 
+extends_documentation_fragment:
+  - mcia.irods.common
+  - mcia.irods.common.trace
+  - mcia.irods.common.diff
+
 author:
   - "Pierre Gay (@pigay)"
 '''
@@ -50,16 +59,32 @@ EXAMPLES = r'''
     limits:
       '%demoGroup': 20000
       demoUser: 30000
+
+- name: Set quotas of several users on several resources
+  mcia.irods.irods_user_quota:
+    zone: demoZone
+    limits:
+      demoUser1:
+        total: 100000
+        demoResc: 30000
+      demoUser2:
+        demoResc: 30000
+        otherResc: 50000
 '''
 
 from ansible.module_utils.basic import AnsibleModule
 
 from ansible_collections.mcia.irods.plugins.module_utils.irods_utils import (
-    IrodsQuest,
-    IrodsAdmin,
-    get_zones,
+    IrodsAdminSession,
     rescs_id_name,
-    get_user_groups,
+    irods_common_argument_spec,
+    irods_diff_argument_spec,
+    irods_quest,
+    load_catalog_snapshot,
+    local_zone,
+    render_diff,
+    select_in,
+    instrument_module,
 )
 
 _QUOTA_FIELDS = [
@@ -76,56 +101,54 @@ _QUOTA_PARAM_FIELDS = {
 }
 
 
-def get_quotas(module):
-
-    # get resc names from their id
-    rescs = rescs_id_name(module)
-    rescs[0] = 'total'
-
-    iquest = IrodsQuest()
+def quota_key(quota):
+    return (
+        quota['QUOTA_USER_NAME'],
+        quota['QUOTA_USER_ZONE'],
+        quota['QUOTA_RESC_ID'],
+    )
 
-    fmt = ':'.join(['%s'] * len(_QUOTA_FIELDS))
 
+def get_quota_rows(module, names=None):
+    '''Returns catalog quotas indexed by (user/group name, zone, resource),
+    restricted to `names` if given. Resources are given by id.
+    '''
     where = []
 
     if (module.params['zone'] is not None):
-        where += ['QUOTA_USER_ZONE = \'%s\'' % module.params['zone']]
-
-    cmd = 'select {} where {}'.format(
-        ', '.join(_QUOTA_FIELDS),
-        ' and '.join(where)
-    )
-
-    r, o, e = module.run_command(iquest(['--no-page', fmt, cmd]))
+        where += [('QUOTA_USER_ZONE', '=', module.params['zone'])]
 
-    if (r!= 1 and r != 0) or (r==1 and 'CAT_NO_ROWS_FOUND' not in o):
-        module.fail_json(
-            msg='iquest fmt=\'%s\' cmd=\'%s\' failed with code=%s output=\'%s\' error=\'%s\'' %
-            (fmt, cmd, r, o, e)
-        )
+    if names is None:
+        rows = irods_quest(module).iter_select(module, _QUOTA_FIELDS, where)
+    else:
+        rows = select_in(module, _QUOTA_FIELDS, 'QUOTA_USER_NAME', names,
+                         where)
 
-    if 'CAT_NO_ROWS_FOUND' in o:
-        return {}
-
-    quotas = {}
+    return {quota_key(quota): quota for quota in rows}
 
-    for l in o.strip().split('\n'):
-        values = l.strip().split(':')
-        quota = dict(zip(_QUOTA_FIELDS, values))
 
-        # translate resc id to name
-        quota['QUOTA_RESC_ID'] = rescs[int(quota['QUOTA_RESC_ID'])]
+def name_quota_rescs(quotas, rescs):
+    '''Translates quota resource ids to names, using the resource id/name dict
+    `rescs`
+    '''
+    named = {}
 
-        # convrt limit to int
-        quota['QUOTA_LIMIT'] = int(quota['QUOTA_LIMIT'])
+    for quota in quotas.values():
+        # id 0 stands for total (all resources) quotas
+        rid = quota['QUOTA_RESC_ID']
+        quota['QUOTA_RESC_ID'] = 'total' if rid == 0 else rescs[rid]
+        named[quota_key(quota)] = quota
 
-        quotas[quota['QUOTA_USER_NAME']] = quota
+    return named
 
-    return quotas
 
+def get_quotas(module, names=None):
+    return name_quota_rescs(get_quota_rows(module, names),
+                            rescs_id_name(module))
 
 
-def params_to_quotas(params):
+def params_to_quotas(module):
+    params = module.params
     skel = {}
 
     for k, v in _QUOTA_PARAM_FIELDS.items():
@@ -141,12 +164,28 @@ def params_to_quotas(params):
             user = user[1:]
             qdict = group_quotas
 
-        u = skel.copy()
+        if isinstance(limit, dict):
+            limits = limit
+        else:
+            limits = {skel['QUOTA_RESC_ID']: limit}
 
-        u['QUOTA_USER_NAME'] = user
-        u['QUOTA_LIMIT'] = limit
+        for resource, limit in limits.items():
+            u = skel.copy()
 
-        qdict[user] = u
+            try:
+                limit = int(limit)
+            except (TypeError, ValueError):
+                module.fail_json(
+                    msg='invalid quota limit \'%s\' of %s on resource %s' %
+                    (limit, '%' + user if qdict is group_quotas else user,
+                     resource)
+                )
+
+            u['QUOTA_USER_NAME'] = user
+            u['QUOTA_RESC_ID'] = resource
+            u['QUOTA_LIMIT'] = limit
+
+            qdict[quota_key(u)] = u
 
     return quotas, group_quotas
 
@@ -159,31 +198,17 @@ def qprint(q, type):
         str(q['QUOTA_LIMIT']),
     ])
 
-def quotas_to_string(quotas, type):
-
-    return '\n'.join([qprint(quotas[k], type) for k in sorted(quotas.keys())]) + '\n'
-
+def quotas_to_lines(quotas, type):
+    return {(type,) + k: qprint(q, type) for k, q in quotas.items()}
 
-def set_quota(module, type, user, zone, resource, limit):
-    iadmin = IrodsAdmin()
 
-    cmd = [f's{type}q', user + '#' + zone, resource, str(limit)]
-    r, o, e = module.run_command(iadmin(cmd))
-    module.warn(f'set_quota {cmd}')
-
-    if r != 0:
-        module.fail_json(
-            msg='iadmin cmd=\'%s\' failed with code=%s error=\'%s\'' %
-            (cmd, r, e)
-        )
-
-
-def set_user_quota(module, user, zone, resource, limit):
-    return set_quota(module, 'u', user, zone, resource, limit)
-
-
-def set_group_quota(module, user, zone, resource, limit):
-    return set_quota(module, 'g', user, zone, resource, limit)
+def set_quota_cmd(type, q):
+    return [
+        f's{type}q',
+        q['QUOTA_USER_NAME'] + '#' + q['QUOTA_USER_ZONE'],
+        q['QUOTA_RESC_ID'],
+        str(q['QUOTA_LIMIT']),
+    ]
 
 
 def main():
@@ -194,11 +219,14 @@ def main():
         ),
         resource=dict(type='str', default='total')
     )
+    module_args.update(irods_common_argument_spec())
+    module_args.update(irods_diff_argument_spec())
 
     module = AnsibleModule(
         argument_spec=module_args,
         supports_check_mode=True
     )
+    instrument_module(module)
 
     result = dict(
         changed=False,
@@ -208,58 +236,57 @@ def main():
     # we need a zone to ensure we get unique users
     if module.params['zone'] is None:
         # default to local zone (must be only one)
-        local_zone = get_zones(module, ZONE_TYPE='local')[0]
-        module.params['zone'] = local_zone['ZONE_NAME']
-
+        module.params['zone'] = local_zone(module)
 
-    got = get_quotas(module)
 
-    user_quotas, group_quotas = params_to_quotas(module.params)
-
-    user_groups = get_user_groups(module, module.params['zone'])
+    user_quotas, group_quotas = params_to_quotas(module)
+    names = set(k[0] for k in user_quotas) | set(k[0] for k in group_quotas)
 
+    snapshot = load_catalog_snapshot(
+        module,
+        ['rescs'],
+        quotas=lambda m: get_quota_rows(m, names),
+    )
 
-    # for g, q in group_quotas.items():
-    #     for u in user_groups[g]:
-    #         if u not in user_quotas:
-    #             user_quotas[u] = got[u].copy()
-    #             user_quotas[u]['QUOTA_LIMIT'] = q['QUOTA_LIMIT']
+    got = name_quota_rescs(snapshot.quotas, snapshot.rescs)
 
     # filter got users with those specified in params
     got_users = {k: v.copy() for k, v in got.items() if k in user_quotas}
     got_groups = {k: v.copy() for k, v in got.items() if k in group_quotas}
 
+    # iRODS removes quotas set to 0
+    for wanted, current in [(user_quotas, got_users),
+                            (group_quotas, got_groups)]:
+        for k, v in wanted.items():
+            if k not in current and v['QUOTA_LIMIT'] == 0:
+                current[k] = v.copy()
+
 
     if got_users != user_quotas or got_groups != group_quotas:
         result['changed'] = True
 
     if module._diff:
-        result['diff'] = dict(
-            before=(quotas_to_string(got_users, 'u') + quotas_to_string(got_groups, 'g')).strip(),
-            after=(quotas_to_string(user_quotas, 'u') + quotas_to_string(group_quotas, 'g')).strip()
-        )
+        before = quotas_to_lines(got_users, 'u')
+        before.update(quotas_to_lines(got_groups, 'g'))
+        after = quotas_to_lines(user_quotas, 'u')
+        after.update(quotas_to_lines(group_quotas, 'g'))
+
+        result['diff'] = render_diff(module, before, after)
 
     if module.check_mode or not result['changed']:
         module.exit_json(**result)
 
-    for k, v in user_quotas.items():
-        if v != got_users.get(k):
-            result['operations'].append(qprint(v, 'u'))
-            set_user_quota(module,
-                           v['QUOTA_USER_NAME'],
-                           v['QUOTA_USER_ZONE'],
-                           v['QUOTA_RESC_ID'],
-                           v['QUOTA_LIMIT'])
-            
-
-    for k, v in group_quotas.items():
-        if v != got_groups.get(k):
-            result['operations'].append(qprint(v, 'g'))
-            set_group_quota(module,
-                           v['QUOTA_USER_NAME'],
-                           v['QUOTA_USER_ZONE'],
-                           v['QUOTA_RESC_ID'],
-                           v['QUOTA_LIMIT'])
+    # apply the whole matrix in a single iadmin session
+    session = IrodsAdminSession(module)
+
+    for type, wanted, current in [('u', user_quotas, got_users),
+                                  ('g', group_quotas, got_groups)]:
+        for k, v in wanted.items():
+            if v != current.get(k):
+                result['operations'].append(qprint(v, type))
+                session.add(set_quota_cmd(type, v))
+
+    session.run()
 
     module.exit_json(**result)
 
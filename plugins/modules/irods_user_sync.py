@@ -0,0 +1,383 @@
+#! /usr/bin/python
+
+
+DOCUMENTATION = r'''
+---
+module: irods_user_sync
+
+short_description: synchronize iRODS users with a source file
+
+description:
+  - "Synchronizes iRODS users with the users listed in a CSV or LDIF file
+     found on the managed host."
+  - "Both the source file and the catalog users are sorted by name on disk,
+     by batches of `batch_size` users, and walked side by side. Memory use
+     thus depends on `batch_size`, not on the number of users."
+  - "To use this module, `become_user` must be set to a unix user configured to
+     have access to a rodsadmin iRODS user."
+
+options:
+  src:
+    description: path of the source file on the managed host
+    required: true
+    type: path
+  format:
+    description:
+      - "Format of the source file. `csv` files must start with a header
+         line naming their columns. `ldif` files hold one entry per user."
+    required: false
+    type: str
+    choices: [csv, ldif]
+    default: csv
+  attributes:
+    description:
+      - "Source column (`csv`) or attribute (`ldif`) of each user field:
+         `name`, `type`, `info` and `comment`. Fields without a column or
+         attribute in the source file are left untouched, except `type`
+         which is enforced to the `type` option when it is set."
+      - "Defaults to columns named after the user fields for `csv`, and to
+         the `uid` attribute for the name with `ldif`."
+    required: false
+    type: dict
+  zone:
+    description: name of iRODS zone
+    required: false
+    type: str
+    default: <local zone>
+  type:
+    description:
+      - "Type of the users not given a type by the source file. When unset,
+         the type of existing users is left untouched and new users are
+         created as `rodsuser`."
+    required: false
+    type: str
+    choices: [rodsadmin, rodsgroup, rodsuser]
+  delete:
+    description:
+      - "Removes the catalog users of type `type` (`rodsuser` when unset)
+         that are missing from the source file, except those listed in
+         `exclude`."
+    required: false
+    type: bool
+    default: false
+  exclude:
+    description: names of the users never removed by `delete`
+    required: false
+    type: list
+    elements: str
+    default: []
+  batch_size:
+    description:
+      - "Number of users sorted at once in memory, and number of iadmin
+         commands run per iadmin session."
+    required: false
+    type: int
+    default: 10000
+
+extends_documentation_fragment:
+  - mcia.irods.common
+  - mcia.irods.common.trace
+
+author:
+  - "Pierre Gay (@pigay)"
+'''
+
+EXAMPLES = r'''
+- name: synchronize iRODS users with an LDAP export
+  mcia.irods.irods_user_sync:
+    src: /var/lib/ldap-export/people.ldif
+    format: ldif
+    attributes:
+      name: uid
+      comment: cn
+    delete: true
+    exclude:
+      - rods
+'''
+
+RETURN = r'''
+added:
+  description: number of users added
+  returned: success
+  type: int
+modified:
+  description: number of user attributes modified
+  returned: success
+  type: int
+deleted:
+  description: number of users removed
+  returned: success
+  type: int
+'''
+
+import base64
+import csv
+
+from ansible.module_utils.basic import AnsibleModule
+
+from ansible_collections.mcia.irods.plugins.module_utils.irods_utils import (
+    IrodsAdminSession,
+    irods_common_argument_spec,
+    add_user_cmd,
+    delete_user_cmd,
+    external_sort,
+    iter_users,
+    local_zone,
+    modify_user_cmd,
+    instrument_module,
+)
+
+# user fields given by source files
+_SOURCE_FIELDS = {
+    'name': 'USER_NAME',
+    'type': 'USER_TYPE',
+    'info': 'USER_INFO',
+    'comment': 'USER_COMMENT',
+}
+
+# type of new users not given one by the source file nor the type option
+_DEFAULT_TYPE = 'rodsuser'
+
+_DEFAULT_ATTRIBUTES = {
+    'csv': dict(name='name', type='type', info='info', comment='comment'),
+    'ldif': dict(name='uid'),
+}
+
+
+def user_name(user):
+    return user['USER_NAME']
+
+
+def read_csv(f):
+    '''Yields CSV rows as dicts indexed by the header line columns
+    '''
+    return csv.DictReader(f)
+
+
+def read_ldif(f):
+    '''Yields LDIF entries as dicts of the first value of each attribute,
+    indexed by lower case attribute names
+    '''
+    lines = []
+
+    for line in f:
+        line = line.rstrip('\r\n')
+
+        if line.startswith(' ') and lines:
+            # folded line
+            lines[-1] += line[1:]
+        elif line and not line.startswith('#'):
+            lines.append(line)
+        elif not line and lines:
+            yield _ldif_entry(lines)
+            lines = []
+
+    if lines:
+        yield _ldif_entry(lines)
+
+
+def _ldif_entry(lines):
+    entry = {}
+
+    for line in lines:
+        attr, sep, value = line.partition(':')
+        if not sep:
+            continue
+
+        attr = attr.lower()
+        if attr in entry:
+            continue
+
+        if value.startswith(':'):
+            value = base64.b64decode(value[1:].strip()).decode('utf-8')
+
+        entry[attr] = value.strip()
+
+    return entry
+
+
+def source_users(module, f):
+    '''Yields the users described by the source file rows
+    '''
+    params = module.params
+    fmt = params['format']
+    attributes = params['attributes'] or _DEFAULT_ATTRIBUTES[fmt]
+
+    if fmt == 'ldif':
+        rows = read_ldif(f)
+        attributes = {k: v.lower() for k, v in attributes.items()}
+    else:
+        rows = read_csv(f)
+
+    for row in rows:
+        user = dict(USER_ZONE=params['zone'])
+        if params['type'] is not None:
+            user['USER_TYPE'] = params['type']
+
+        for k, v in attributes.items():
+            if k not in _SOURCE_FIELDS:
+                module.fail_json(msg='unknown user field \'%s\' in attributes' % k)
+
+            if row.get(v) is not None:
+                user[_SOURCE_FIELDS[k]] = row[v].strip()
+
+        if not user.get('USER_TYPE'):
+            # only enforced when given
+            user.pop('USER_TYPE', None)
+
+        if user.get('USER_NAME'):
+            yield user
+
+
+def last_of_names(users):
+    '''Yields the last user of each run of users sharing a name
+    '''
+    last = None
+
+    for user in users:
+        if last is not None and user_name(last) != user_name(user):
+            yield last
+        last = user
+
+    if last is not None:
+        yield last
+
+
+def merge_join(src, got):
+    '''Yields (source user, catalog user) pairs from users sorted by name,
+    with None for the side where a user is missing
+    '''
+    s = next(src, None)
+    g = next(got, None)
+
+    while s is not None or g is not None:
+        if g is None or (s is not None and user_name(s) < user_name(g)):
+            yield s, None
+            s = next(src, None)
+        elif s is None or user_name(g) < user_name(s):
+            yield None, g
+            g = next(got, None)
+        else:
+            yield s, g
+            s = next(src, None)
+            g = next(got, None)
+
+
+def sync_operations(module, pairs):
+    '''Yields (kind, iadmin command) operations turning catalog users into
+    source users
+    '''
+    params = module.params
+    exclude = set(params['exclude'])
+    delete_type = params['type'] or _DEFAULT_TYPE
+
+    for s, g in pairs:
+        if g is None:
+            yield 'added', add_user_cmd(dict({'USER_TYPE': _DEFAULT_TYPE}, **s))
+
+            for attr in ['USER_COMMENT', 'USER_INFO']:
+                if s.get(attr):
+                    yield None, modify_user_cmd(user_name(s), attr, s[attr])
+
+        elif s is None:
+            if (params['delete'] and g['USER_TYPE'] == delete_type
+                    and user_name(g) not in exclude):
+                yield 'deleted', delete_user_cmd(g)
+
+        else:
+            for attr in ['USER_TYPE', 'USER_COMMENT', 'USER_INFO']:
+                if attr in s and s[attr] != g[attr]:
+                    yield 'modified', modify_user_cmd(
+                        user_name(s), attr, s[attr]
+                    )
+
+
+def main():
+    module_args = dict(
+        src=dict(type='path', required=True),
+        format=dict(
+            type='str',
+            default='csv',
+            required=False,
+            choices=['csv', 'ldif'],
+        ),
+        attributes=dict(type='dict', required=False),
+        zone=dict(type='str', required=False),
+        type=dict(
+            type='str',
+            required=False,
+            choices=['rodsadmin', 'rodsgroup', 'rodsuser'],
+        ),
+        delete=dict(type='bool', default=False, required=False),
+        exclude=dict(type='list', elements='str', default=[], required=False),
+        batch_size=dict(type='int', default=10000, required=False),
+    )
+    module_args.update(irods_common_argument_spec())
+
+    module = AnsibleModule(
+        argument_spec=module_args,
+        supports_check_mode=True
+    )
+    instrument_module(module)
+
+    result = dict(
+        changed=False,
+        added=0,
+        modified=0,
+        deleted=0,
+    )
+
+    # we need a zone to ensure we get unique users
+    if module.params['zone'] is None:
+        # default to local zone (must be only one)
+        module.params['zone'] = local_zone(module)
+
+    batch_size = max(module.params['batch_size'], 1)
+
+    try:
+        f = open(module.params['src'], newline='')
+    except (IOError, OSError) as e:
+        module.fail_json(msg='cannot read %s: %s' % (module.params['src'], e))
+
+    with f:
+        src = last_of_names(
+            external_sort(source_users(module, f), user_name, batch_size)
+        )
+        got = external_sort(iter_users(module), user_name, batch_size)
+
+        session = IrodsAdminSession(module)
+        # user modifications, run once users are created
+        modifications = []
+
+        def run():
+            session.barrier()
+            for cmd in modifications:
+                session.add(cmd)
+            del modifications[:]
+
+            session.run()
+
+        for kind, cmd in sync_operations(module, merge_join(src, got)):
+            result['changed'] = True
+
+            if kind is not None:
+                result[kind] += 1
+
+            if module.check_mode:
+                continue
+
+            if cmd[0] == 'moduser':
+                modifications.append(cmd)
+            else:
+                session.add(cmd)
+
+            if len(session) + len(modifications) >= batch_size:
+                run()
+
+        run()
+
+    module.exit_json(**result)
+
+
+if __name__ == '__main__':
+    main()